@@ -0,0 +1,242 @@
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import zipfile
+
+import geopandas as gpd
+import numpy as np
+import pyogrio
+import shapely
+from shapely.geometry import box
+
+from .classes import CitiesShapefile, CountiesShapefile, PADUSShapefile, RailShapefile, us_states_territories
+from .instrumentation import RunStats, stage
+from .permits import identify_permitting_locations, write_report
+
+
+# Feature counts at scale 1.0, roughly the size of the national datasets
+DATASET_SIZES = {"counties": 3000, "cities": 30000, "padus": 300000, "rail": 60000, "route_vertices": 20000}
+
+# Continental US, in lon/lat
+EXTENT = (-124.5, 25.0, -67.0, 49.0)
+
+# Each reference layer, the class that processes it and the CRS its synthetic file is written in
+LAYERS = {
+    "cities": (CitiesShapefile, "EPSG:4326"),
+    "counties": (CountiesShapefile, "EPSG:4269"),
+    "padus": (PADUSShapefile, "EPSG:3857"),
+    "rail": (RailShapefile, "EPSG:3857"),
+}
+
+
+def generate_datasets(data_dir, scale=1.0, seed=0):
+    """Write a synthetic route KMZ and reference shapefiles to ``data_dir``, skipping files that already exist.
+
+    ``scale`` multiplies the feature counts in DATASET_SIZES. The data is random but reproducible for a
+    given seed, and shaped like the real inputs: space-filling counties, small city polygons, many
+    small protected areas (a few of them self-intersecting) and a dense network of rail lines.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    sizes = {name: max(int(size * scale), 10) for name, size in DATASET_SIZES.items()}
+    generators = {
+        "counties": _counties,
+        "cities": _cities,
+        "padus": _padus,
+        "rail": _rail,
+    }
+
+    paths = {"route": os.path.join(data_dir, "route.kmz")}
+    if not os.path.exists(paths["route"]):
+        _write_route(paths["route"], rng, sizes["route_vertices"])
+    for name, generate in generators.items():
+        paths[name] = os.path.join(data_dir, f"{name}.shp")
+        if not os.path.exists(paths[name]):
+            generate(rng, sizes[name]).to_crs(LAYERS[name][1]).to_file(paths[name])
+    return paths
+
+def _write_route(path, rng, n_vertices, n_segments=20):
+    # A meandering line from San Francisco to New York, split into Placemarks like a real route
+    t = np.linspace(0, 1, n_vertices)
+    lon = -122.4 + t * 48.4 + np.cumsum(rng.normal(0, 0.02, n_vertices))
+    lat = 37.8 + t * 2.9 + 3 * np.sin(t * 9) + np.cumsum(rng.normal(0, 0.02, n_vertices))
+
+    placemarks = []
+    for i, part in enumerate(np.array_split(np.arange(n_vertices), n_segments)):
+        part = np.append(part, min(part[-1] + 1, n_vertices - 1))  # Segments share their end vertex
+        coordinates = " ".join(f"{x:.6f},{y:.6f},0" for x, y in zip(lon[part], lat[part]))
+        placemarks.append(f"<Placemark><name>Segment {i + 1}</name><LineString><coordinates>{coordinates}</coordinates></LineString></Placemark>")
+
+    kml = f'<?xml version="1.0" encoding="UTF-8"?><kml xmlns="http://www.opengis.net/kml/2.2"><Document>{"".join(placemarks)}</Document></kml>'
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as kmz:
+        kmz.writestr("doc.kml", kml)
+
+def _random_points(rng, n):
+    return np.column_stack([rng.uniform(EXTENT[0], EXTENT[2], n), rng.uniform(EXTENT[1], EXTENT[3], n)])
+
+def _blobs(rng, n, radius, vertices=8):
+    # Star-shaped polygons around random centres; angles are sorted so the rings are simple
+    centres = _random_points(rng, n)
+    angles = np.sort(rng.uniform(0, 2 * np.pi, (n, vertices)), axis=1)
+    radii = radius[:, None] * rng.uniform(0.5, 1.0, (n, vertices))
+    ring = centres[:, None, :] + np.stack([radii * np.cos(angles), radii * np.sin(angles)], axis=-1)
+    return np.concatenate([ring, ring[:, :1]], axis=1)
+
+def _counties(rng, n):
+    cells = shapely.get_parts(shapely.voronoi_polygons(shapely.multipoints(_random_points(rng, n)), extend_to=box(*EXTENT)))
+    cells = shapely.intersection(cells, box(*EXTENT))
+    states = list(us_states_territories)[:50]
+    return gpd.GeoDataFrame({
+        "NAME": [f"County {i}" for i in range(len(cells))],
+        "STATEFP": [states[i % len(states)] for i in range(len(cells))],
+    }, geometry=cells, crs="EPSG:4326")
+
+def _cities(rng, n):
+    rings = _blobs(rng, n, rng.lognormal(np.log(0.03), 0.6, n))
+    return gpd.GeoDataFrame({
+        "NAME": [f"City {i}" for i in range(n)],
+        "layer": "city",
+    }, geometry=shapely.polygons(rings), crs="EPSG:4326")
+
+def _padus(rng, n, invalid_share=0.01):
+    rings = _blobs(rng, n, rng.lognormal(np.log(0.02), 0.8, n))
+    # Swapping two vertices turns a ring into a bowtie, like the invalid geometries in the real PADUS
+    bowties = rng.random(n) < invalid_share
+    rings[bowties, 1], rings[bowties, 2] = rings[bowties, 2].copy(), rings[bowties, 1].copy()
+    return gpd.GeoDataFrame({"Unit_Nm": [f"Protected Area {i}" for i in range(n)]}, geometry=shapely.polygons(rings), crs="EPSG:4326")
+
+def _rail(rng, n, vertices=20):
+    steps = rng.normal(0, 0.02, (n, vertices, 2)).cumsum(axis=1)
+    coords = _random_points(rng, n)[:, None, :] + steps
+    owners = ["BNSF", "UP", "CSXT", "NS", "CN", "CPKC", "KCS", "AMTK"]
+    return gpd.GeoDataFrame({
+        "SUBDIV": [f"Subdivision {i % 2000}" for i in range(n)],
+        "STATE": [us_states_territories[list(us_states_territories)[i % 50]] for i in range(n)],
+        "RROWNER1": [owners[i % len(owners)] for i in range(n)],
+        "TRKRGHTS1": [owners[(i + 3) % len(owners)] for i in range(n)],
+        "FRAARCID": np.arange(n),
+    }, geometry=shapely.linestrings(coords), crs="EPSG:4326")
+
+
+def run_benchmark(paths, repeat=1, bounded_read=True, cache_dir=None, tile_dir=None, **options):
+    """Run the report pipeline on the datasets in ``paths`` (see generate_datasets) and return the stage timings as a dict.
+
+    Layers go through identify_permitting_locations, as in a batch run, and the stages come from its
+    RunStats. With ``cache_dir``, layers use a LayerCache there, emptied first so the first run is cold
+    and later runs are warm. With ``tile_dir``, layers are read from a TileStore there, built on first
+    use. Other ``options`` (corridor, units, measures, parallel, invalid) are passed on. Each stage reports its
+    best time over the ``repeat`` runs it ran in; ``runs`` has every run's stages and total.
+    """
+    from .cache import LayerCache
+    from .tiles import TileStore
+    
+    cache = None
+    if cache_dir:
+        cache = LayerCache(cache_dir)
+        cache.clear()
+    tiles = TileStore(tile_dir) if tile_dir else None
+    if tiles is not None:
+        invalid = options.get("invalid", "repair")
+        for name, (layer_class, _) in LAYERS.items():
+            if paths.get(name) and not os.path.exists(os.path.join(tiles.tile_dir, tiles.version(layer_class, paths[name], invalid=invalid))):
+                tiles.build(layer_class, paths[name], invalid=invalid)
+    
+    runs = [_run_once(paths, bounded_read=bounded_read, cache=cache, tiles=tiles, **options) for _ in range(repeat)]
+    names = list(dict.fromkeys(name for run in runs for name in run["stages"]))
+    stages = {name: min(run["stages"][name] for run in runs if name in run["stages"]) for name in names}
+    return {
+        "commit": _git_commit(),
+        "environment": {
+            "python": platform.python_version(),
+            "geopandas": gpd.__version__,
+            "shapely": shapely.__version__,
+            "gdal": pyogrio.__gdal_version_string__,
+            "platform": platform.platform(),
+        },
+        "datasets": {name: pyogrio.read_info(path)["features"] for name, path in paths.items() if name in LAYERS and path},
+        "options": {"bounded_read": bounded_read, "cache": cache is not None, "tiles": tiles is not None, **options},
+        "repeat": repeat,
+        "stages": stages,
+        "rows": runs[0]["rows"],
+        "total": min(run["total"] for run in runs),
+        "runs": [{"stages": run["stages"], "total": run["total"]} for run in runs],
+        "imports": measure_imports(),
+    }
+
+def _run_once(paths, **options):
+    stats = RunStats(memory=False)
+    with stats.activate():
+        results = identify_permitting_locations(paths["route"], *(paths.get(name) for name in LAYERS), **options)
+        with tempfile.TemporaryDirectory() as output_dir, stage("report"):
+            write_report("", *results, os.path.join(output_dir, "permit_report.md"))
+    
+    # A stage can run more than once (e.g. a read per layer of a parallel run), so times are summed by name
+    stages, rows = {}, {}
+    for record in stats.records:
+        stages[record.name] = stages.get(record.name, 0) + record.seconds
+        if record.rows is not None:
+            rows[record.name] = rows.get(record.name, 0) + record.rows
+    return {"stages": stages, "rows": rows, "total": stats.total_seconds}
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# What QGIS imports from the plugin at startup, and the packages that must wait until a report is run
+STARTUP_MODULES = ["uterra_plugin", "qgis_layers", "instrumentation"]
+HEAVY_MODULES = ["geopandas", "shapely", "pandas", "numpy", "pyarrow", "pyogrio", "openai"]
+
+# Seconds the plugin may add to QGIS startup, not counting QGIS itself
+STARTUP_BUDGET = 0.05
+
+def measure_imports(modules=STARTUP_MODULES):
+    """Import each of the package's ``modules`` in a fresh interpreter and return how long it took.
+
+    QGIS is imported before the clock starts, since it is loaded at startup anyway. Each result has
+    the import ``seconds`` and the HEAVY_MODULES it pulled in, or an ``error`` when the module cannot
+    be imported here (the plugin modules need QGIS).
+    """
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    script = f"""
+import importlib, json, sys, time
+sys.path.insert(0, {os.path.dirname(package_dir)!r})
+try:
+    import qgis.core, qgis.PyQt.QtWidgets
+except ImportError:
+    pass
+start = time.perf_counter()
+try:
+    importlib.import_module({os.path.basename(package_dir)!r} + "." + sys.argv[1])
+except ImportError as e:
+    print(json.dumps({{"error": str(e)}}))
+else:
+    print(json.dumps({{"seconds": time.perf_counter() - start, "heavy": [name for name in {HEAVY_MODULES!r} if name in sys.modules]}}))
+"""
+    results = {}
+    for module in modules:
+        output = subprocess.run([sys.executable, "-c", script, module], capture_output=True, text=True, check=True).stdout
+        results[module] = json.loads(output.strip().splitlines()[-1])
+    return results
+
+def check_startup(imports, budget=STARTUP_BUDGET):
+    """Return a line per startup module that is over ``budget`` or imports a heavy package; empty when all are fine."""
+    problems = []
+    for module, result in imports.items():
+        if "error" in result:
+            continue
+        if result["seconds"] > budget:
+            problems.append(f"{module}: {result['seconds']:.3f} s to import, over the {budget:.3f} s budget")
+        if result["heavy"]:
+            problems.append(f"{module}: imports {', '.join(result['heavy'])} at startup")
+    return problems
+
+def write_results(results, output_path):
+    with open(output_path, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Benchmark results saved to {output_path}")
@@ -0,0 +1,267 @@
+import hashlib
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import closing
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import shapely
+
+
+DEFAULT_CACHE_DIR = os.environ.get("UTERRA_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".uterra", "layer_cache"))
+
+# Files that make up a shapefile; editing any of them must invalidate the cached layer
+SHAPEFILE_SIDECARS = (".shp", ".shx", ".dbf", ".prj", ".cpg")
+
+
+def source_key(shapefile_path, *options):
+    """Return a key that changes whenever ``shapefile_path`` (or a sidecar file) is edited or ``options`` differ."""
+    root, ext = os.path.splitext(os.path.abspath(shapefile_path))
+    paths = [root + sidecar for sidecar in SHAPEFILE_SIDECARS] if ext.lower() == ".shp" else [root + ext]
+
+    parts = [os.path.abspath(shapefile_path)]
+    for path in paths:
+        if os.path.exists(path):
+            stat = os.stat(path)
+            parts.append(f"{path}:{stat.st_size}:{stat.st_mtime_ns}")
+    parts.extend(repr(option) for option in options)
+    return hashlib.sha256("|".join(parts).encode()).hexdigest()
+
+
+class LayerCache:
+    """Preprocessed reference layers, kept in an in-process LRU backed by GeoParquet files on disk.
+
+    Entries are keyed by the source path, its size and mtime (and those of its sidecar files) and
+    every option that changes the preprocessed result, so an edited source is simply a cache miss.
+    """
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=2 * 1024**3, max_layers=8):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.max_layers = max_layers
+        self._layers = OrderedDict()
+        self._lock = threading.Lock()
+
+    def key(self, shapefile_path, *options):
+        """Return the cache key for ``shapefile_path`` preprocessed with ``options``."""
+        return source_key(shapefile_path, *options)
+
+    def get(self, key):
+        """Return the cached GeoDataFrame for ``key``, or None on a miss."""
+        with self._lock:
+            if key in self._layers:
+                self._layers.move_to_end(key)
+                return self._layers[key]
+
+        path = self._path(key)
+        try:
+            gdf = gpd.read_parquet(path)
+            os.utime(path)  # Mark as recently used for disk eviction
+        except (OSError, ValueError):
+            return None  # Missing, unreadable, or evicted by another process since the read
+        self._remember(key, gdf)
+        return gdf
+
+    def put(self, key, gdf):
+        """Store a preprocessed layer in memory and on disk, evicting the oldest entries."""
+        self._remember(key, gdf)
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        gdf.to_parquet(tmp_path)
+        os.replace(tmp_path, path)
+        self._evict_disk()
+
+    def resident_layers(self):
+        """Return how many layers are held in memory."""
+        with self._lock:
+            return len(self._layers)
+
+    def clear(self):
+        """Drop every cached layer, in memory and on disk."""
+        with self._lock:
+            self._layers.clear()
+        for path in self._files():
+            os.remove(path)
+
+    def _remember(self, key, gdf):
+        gdf.sindex  # Build the spatial index once, while the layer is resident
+        with self._lock:
+            self._layers[key] = gdf
+            self._layers.move_to_end(key)
+            while len(self._layers) > self.max_layers:
+                self._layers.popitem(last=False)
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.parquet")
+
+    def _files(self):
+        if not os.path.isdir(self.cache_dir):
+            return []
+        return [os.path.join(self.cache_dir, name) for name in os.listdir(self.cache_dir) if name.endswith(".parquet")]
+
+    def _evict_disk(self):
+        try:
+            files = sorted((os.stat(path).st_mtime, os.stat(path).st_size, path) for path in self._files())
+        except FileNotFoundError:
+            return  # Another process is evicting at the same time
+        total = sum(size for _, size, _ in files)
+
+        # Oldest first, but never the entry that was just written
+        for _, size, path in files[:-1]:
+            if total <= self.max_bytes:
+                break
+            total -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+
+DEFAULT_RESULT_DIR = os.environ.get("UTERRA_RESULT_DIR", os.path.join(os.path.expanduser("~"), ".uterra", "results"))
+
+# Marks a route segment that was joined and matched nothing
+NO_MATCH = -1
+
+
+class ResultStore:
+    """Join results per route segment, so re-running an edited route only joins the segments that changed.
+
+    For every reference layer version (see ``source_key``) the store keeps the features matched by each
+    segment, keyed by a hash of the segment geometry, and a copy of those matched features. Segments not
+    seen for ``max_age_days`` are dropped when the store is saved.
+    """
+    def __init__(self, store_dir=DEFAULT_RESULT_DIR, max_age_days=30):
+        self.store_dir = store_dir
+        self.max_age_days = max_age_days
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def segment_hashes(segments):
+        """Return a 64-bit content hash for every segment geometry."""
+        return np.array([
+            int.from_bytes(hashlib.blake2b(wkb, digest_size=8).digest(), "little", signed=True)
+            for wkb in shapely.to_wkb(segments.geometry.values)
+        ], dtype="int64")
+
+    def load(self, version):
+        """Return ``(pairs, features)`` stored for a layer version; pairs has segment, index_right and used columns."""
+        try:
+            pairs = pd.read_parquet(self._path(version, "pairs"))
+            features = gpd.read_parquet(self._path(version, "features"))
+        except (OSError, ValueError):
+            return pd.DataFrame({"segment": pd.Series(dtype="int64"), "index_right": pd.Series(dtype="int64"), "used": pd.Series(dtype="float64")}), None
+        return pairs, features
+
+    def save(self, version, pairs, features):
+        pairs = pairs[pairs["used"] >= time.time() - self.max_age_days * 86400]
+        features = features[features.index.isin(pairs["index_right"])]
+
+        os.makedirs(os.path.join(self.store_dir, version), exist_ok=True)
+        with self._lock:
+            for name, frame in (("pairs", pairs), ("features", features)):
+                tmp_path = f"{self._path(version, name)}.{os.getpid()}.{threading.get_ident()}.tmp"
+                frame.to_parquet(tmp_path)
+                os.replace(tmp_path, self._path(version, name))
+
+    def clear(self):
+        shutil.rmtree(self.store_dir, ignore_errors=True)
+
+    def _path(self, version, name):
+        return os.path.join(self.store_dir, version, f"{name}.parquet")
+
+
+DEFAULT_GUIDANCE_PATH = os.environ.get("UTERRA_GUIDANCE_DB", os.path.join(os.path.expanduser("~"), ".uterra", "guidance.sqlite"))
+
+
+class GuidanceCache:
+    """LLM permitting guidance per jurisdiction, kept in SQLite so repeat corridors skip the API.
+
+    Entries are keyed by report section, jurisdiction (e.g. "Salt Lake, Utah" or a rail owner), model
+    and prompt version, so changing either of the last two is a miss. Entries expire after ``ttl_days``.
+    """
+    def __init__(self, path=DEFAULT_GUIDANCE_PATH, ttl_days=90):
+        self.path = path
+        self.ttl_days = ttl_days
+
+    def get(self, section, jurisdictions, model, prompt_version):
+        """Return ``{jurisdiction: guidance}`` for the jurisdictions that have fresh guidance."""
+        if not jurisdictions or not os.path.exists(self.path):
+            return {}
+        rows = []
+        with closing(self._connect()) as connection:
+            # Query in batches; older SQLite builds allow at most 999 parameters per statement
+            for start in range(0, len(jurisdictions), 500):
+                batch = jurisdictions[start:start + 500]
+                rows += connection.execute(
+                    f"SELECT jurisdiction, guidance FROM guidance WHERE section = ? AND model = ? AND prompt_version = ? AND created >= ? AND jurisdiction IN ({', '.join('?' * len(batch))})",
+                    [section, model, prompt_version, self._oldest(), *batch],
+                ).fetchall()
+        return dict(rows)
+
+    def put(self, section, guidance, model, prompt_version):
+        """Store ``{jurisdiction: guidance}`` for a section and drop expired entries."""
+        if not guidance:
+            return
+        now = time.time()
+        with closing(self._connect()) as connection, connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO guidance VALUES (?, ?, ?, ?, ?, ?)",
+                [(section, jurisdiction, model, prompt_version, text, now) for jurisdiction, text in guidance.items()],
+            )
+            connection.execute("DELETE FROM guidance WHERE created < ?", [self._oldest()])
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _oldest(self):
+        return time.time() - self.ttl_days * 86400
+
+    def _connect(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        connection = sqlite3.connect(self.path, timeout=30)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS guidance (section TEXT, jurisdiction TEXT, model TEXT, prompt_version INTEGER, guidance TEXT, created REAL, "
+            "PRIMARY KEY (section, jurisdiction, model, prompt_version))"
+        )
+        return connection
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+def default_cache():
+    """Return the process-wide LayerCache, creating it on first use."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = LayerCache()
+        return _default_cache
+
+
+_default_store = None
+
+def default_store():
+    """Return the process-wide ResultStore, creating it on first use."""
+    global _default_store
+    with _default_cache_lock:
+        if _default_store is None:
+            _default_store = ResultStore()
+        return _default_store
+
+
+_default_guidance_cache = None
+
+def default_guidance_cache():
+    """Return the process-wide GuidanceCache, creating it on first use."""
+    global _default_guidance_cache
+    with _default_cache_lock:
+        if _default_guidance_cache is None:
+            _default_guidance_cache = GuidanceCache()
+        return _default_guidance_cache
@@ -1,9 +1,13 @@
 import geopandas as gpd
-from fastkml import kml
-from shapely.geometry import LineString, MultiLineString
+import numpy as np
+import pandas as pd
+import shapely
+from shapely.geometry import box
+import os
 import zipfile
 import xml.etree.ElementTree as ET
-import pygeoif
+
+from .instrumentation import stage
 
 
 us_states_territories = {
@@ -66,31 +70,392 @@ us_states_territories = {
     "78": "Virgin Islands"
 }
 
+# Meters per unit accepted for corridor distances
+DISTANCE_UNITS = {"m": 1.0, "ft": 0.3048, "mi": 1609.344}
+METERS_PER_MILE = DISTANCE_UNITS["mi"]
+
+def to_meters(distance, units="ft"):
+    if units not in DISTANCE_UNITS:
+        raise ValueError(f"Unsupported distance units '{units}'. Use one of: {', '.join(DISTANCE_UNITS)}.")
+    return distance * DISTANCE_UNITS[units]
+
+
+def route_mask(route, crs, distance=0):
+    """Return a polygon covering every part of ``route`` in ``crs``, for bounded reads.
+
+    ``route`` may be a line object, a GeoDataFrame/GeoSeries, a shapely geometry or a
+    ``(minx, miny, maxx, maxy)`` bbox; bare geometries and bboxes are taken as EPSG:4326.
+    ``distance`` (meters) widens the mask to cover a corridor either side of the route.
+    """
+    if isinstance(route, (LineKMZ, LineShapefile, RouteSet)):
+        route = route.gdf if route.segments is None else route.segments
+    if isinstance(route, tuple):
+        route = box(*route)
+    if not isinstance(route, (gpd.GeoDataFrame, gpd.GeoSeries)):
+        route = gpd.GeoSeries([route], crs="EPSG:4326")
+    geoms = route.geometry.explode(index_parts=False)
+    
+    if distance:
+        # Pad in degrees, using the shortest degree of longitude each part reaches so the pad never falls short
+        bounds = geoms.to_crs("EPSG:4326").bounds.to_numpy()
+        lat = np.radians(np.minimum(np.abs(bounds[:, [1, 3]]).max(axis=1), 89))
+        dy = distance / 110_000
+        dx = dy / np.cos(lat)
+        padded = shapely.box(bounds[:, 0] - dx, bounds[:, 1] - dy, bounds[:, 2] + dx, bounds[:, 3] + dy)
+        geoms = gpd.GeoSeries(padded, crs="EPSG:4326").segmentize(0.01)
+    geoms = geoms.to_crs(crs)
+    
+    # One envelope per route part rather than one for the whole route, padded so that
+    # horizontal or vertical parts still give a polygon with some area
+    pad = 1e-6 if geoms.crs.is_geographic else 0.1
+    bounds = geoms.bounds.to_numpy()
+    envelopes = shapely.box(bounds[:, 0] - pad, bounds[:, 1] - pad, bounds[:, 2] + pad, bounds[:, 3] + pad)
+    return shapely.union_all(envelopes)
+
+
+def utm_zones(geoms):
+    """Return the EPSG code of the UTM zone containing each geometry's centroid."""
+    centroids = geoms.to_crs("EPSG:4326").representative_point()
+    zone = np.clip(np.floor((centroids.x.to_numpy() + 180) / 6).astype(int) + 1, 1, 60)
+    return np.where(centroids.y.to_numpy() >= 0, 32600, 32700) + zone
+
+
+def segment_lines(gdf, segment_length=5000):
+    """Split every line in ``gdf`` into pieces that each start in one cell of a fixed ``segment_length``
+    meter grid, keeping the source index.
+
+    Long routes have envelopes spanning several states, which defeats the spatial index in ``sjoin``;
+    bounded pieces keep the candidate set down to features that are actually near the route. Because
+    pieces break where the route crosses the grid rather than at distances along it, editing one part
+    of a route leaves the pieces everywhere else unchanged.
+    """
+    lines = gdf.geometry.explode(index_parts=False)
+    step = segment_length / 111_320 if lines.crs is not None and lines.crs.is_geographic else segment_length
+    coords, part = shapely.get_coordinates(lines.segmentize(step).values, return_index=True)
+    
+    # Edge e runs from vertex starts[e] to starts[e] + 1 within a single part
+    starts = np.flatnonzero(part[1:] == part[:-1])
+    if not len(starts):
+        return gpd.GeoDataFrame(geometry=[], crs=gdf.crs)
+    edge_part = part[starts]
+    
+    # A new piece begins with each part and wherever an edge starts in a different grid cell
+    cell = np.floor(coords[starts] / step)
+    new_piece = np.r_[True, (edge_part[1:] != edge_part[:-1]) | (cell[1:] != cell[:-1]).any(axis=1)]
+    piece = np.cumsum(new_piece) - 1
+    last_edge = np.r_[new_piece[1:], True]
+    
+    # Each piece is the start vertex of its edges plus the end vertex of its last edge
+    vertices = np.concatenate([starts, starts[last_edge] + 1])
+    vertex_piece = np.concatenate([piece, piece[last_edge]])
+    order = np.argsort(np.concatenate([2 * np.arange(len(starts)), 2 * np.flatnonzero(last_edge) + 1]), kind="stable")
+    pieces = shapely.linestrings(coords[vertices[order]], indices=vertex_piece[order])
+    
+    return gpd.GeoDataFrame(geometry=pieces, index=lines.index[edge_part[new_piece]], crs=gdf.crs)
+
+
+def from_zones(geoms, zones, crs):
+    """Reproject geometries that are each in the UTM zone (EPSG code) in ``zones`` to ``crs``, one batch per zone."""
+    result = np.empty(len(geoms), dtype=object)
+    for zone in np.unique(zones):
+        at = zones == zone
+        result[at] = gpd.GeoSeries(geoms[at], crs=f"EPSG:{zone}").to_crs(crs).to_numpy()
+    return result
+
+
+def line_lengths(geoms):
+    """Return the length of each line in meters, measured in its own UTM zone."""
+    zones = utm_zones(geoms)
+    lengths = pd.Series(np.nan, index=geoms.index)
+    for zone in np.unique(zones):
+        lengths[zones == zone] = geoms[zones == zone].to_crs(epsg=zone).length.to_numpy()
+    return lengths
+
+
+def route_offsets(linefile_gdf):
+    """Return the distance in meters from the start of the route to the start of each route feature.
+
+    Features (e.g. KMZ placemarks) are taken in order, so mileposts continue from one to the next. With
+    a ``route_id`` column, as in a RouteSet, each route is measured from its own start.
+    """
+    lengths = line_lengths(linefile_gdf.geometry)
+    routes = linefile_gdf["route_id"].to_numpy() if "route_id" in linefile_gdf else np.zeros(len(lengths))
+    return lengths.groupby(routes, sort=False).cumsum() - lengths
+
+
+def line_parts(linefile):
+    """Return ``(gdf, segments)`` for a line object or a plain GeoDataFrame; ``segments`` may be None."""
+    if isinstance(linefile, (LineKMZ, LineShapefile, RouteSet)):
+        return linefile.gdf, linefile.segments
+    return linefile, None
+
+
+INVALID_GEOMETRY_MODES = ("repair", "drop", "fail")
+
+def repair_geometries(gdf, invalid="repair"):
+    """Handle invalid geometries in one batch over the whole geometry array.
+
+    ``invalid`` is "repair" (``make_valid``, dropping only what collapses to nothing), "drop" or "fail".
+    Missing geometries are always dropped. Returns the cleaned GeoDataFrame and a dict with the number
+    of features repaired and dropped.
+    """
+    if invalid not in INVALID_GEOMETRY_MODES:
+        raise ValueError(f"Unsupported invalid geometry mode '{invalid}'. Use one of: {', '.join(INVALID_GEOMETRY_MODES)}.")
+    
+    geoms = gdf.geometry.values
+    missing = shapely.is_missing(geoms)
+    broken = ~missing & ~shapely.is_valid(geoms)
+    stats = {"repaired": 0, "dropped": int(missing.sum())}
+    if not broken.any():
+        return (gdf[~missing] if stats["dropped"] else gdf), stats
+    
+    if invalid == "fail":
+        raise ValueError(f"Layer has {broken.sum()} invalid geometries.")
+    
+    if invalid == "drop":
+        keep = ~missing & ~broken
+    else:
+        fixed = geoms.copy()
+        fixed[broken] = shapely.make_valid(geoms[broken])
+        gdf = gdf.set_geometry(fixed)
+        keep = ~missing & ~shapely.is_empty(fixed)
+        stats["repaired"] = int((broken & keep).sum())
+    
+    stats["dropped"] = int((~keep).sum())
+    return gdf[keep], stats
+
+
+def map_categories(values, mapping):
+    """Map a column through ``mapping`` once per distinct value instead of once per row, returning a categorical.
+
+    Values missing from ``mapping`` become NaN, as with ``Series.map``.
+    """
+    values = values.astype("category")
+    names = values.cat.categories.map(mapping)
+    categories = pd.Index(names.dropna().unique())
+    # Old code to new code; the extra last entry maps the missing-value code -1 to itself
+    recode = np.append(categories.get_indexer(names), -1)
+    codes = recode[values.cat.codes.to_numpy()]
+    return pd.Series(pd.Categorical.from_codes(codes, categories), index=values.index, name=values.name)
+
+
+def select_near_route(gdf, route, distance=0):
+    """Return the rows of ``gdf`` that can intersect ``route`` (within ``distance`` meters), using its spatial index."""
+    rows = gdf.sindex.query(route_mask(route, gdf.crs, distance), predicate="intersects")
+    return gdf.iloc[np.sort(rows)]
+
+
 class Shapefile:
-    def __init__(self, shapefile_path, crs="EPSG:4326", convert_crs=True):
-        self.shapefile_path = shapefile_path
+    def __init__(self, shapefile_path, crs="EPSG:4326", convert_crs=None, mask=None, cache=None, mask_distance=0, invalid="repair", columns=None):
+        # The layer stays in its own CRS (``crs`` when the source has none) unless ``convert_crs`` asks
+        # for another; routes are transformed into the layer's CRS for each join instead (see join_route)
+        self.shapefile_path = shapefile_path if isinstance(shapefile_path, str) else None
         self.crs = crs
-        self.gdf = gpd.read_file(shapefile_path)
+        self.columns = columns or self.columns
+        self.repair_stats = None
+        self.hulls = None
+        
+        # A GeoDataFrame that is already in memory is preprocessed as if it had been read from disk
+        if isinstance(shapefile_path, gpd.GeoDataFrame):
+            self.crs = shapefile_path.crs or crs
+            self.gdf = shapefile_path.set_crs(self.crs)
+            if mask is not None:
+                with stage("select", self.layer_name) as record:
+                    self.gdf = select_near_route(self.gdf, mask, mask_distance)
+                    record.rows = len(self.gdf)
+            self.preprocess(convert_crs, invalid)
+            return
+        
+        # Features are indexed by their FID, so the same feature has the same index however it was read
+        if cache is None:
+            # When a route (or its bbox) is given, only read the features that can touch it
+            with stage("read", self.layer_name) as record:
+                self.gdf = gpd.read_file(shapefile_path, columns=self.columns, mask=route_mask(mask, crs, mask_distance) if mask is not None else None, fid_as_index=True).rename_axis(None)
+                record.rows = len(self.gdf)
+            self.preprocess(convert_crs, invalid)
+            return
+        
+        # The cache holds the whole preprocessed layer, so the route filter runs on its spatial index
+        key = cache.key(shapefile_path, crs, convert_crs, invalid, self.columns)
+        with stage("cache", self.layer_name) as record:
+            gdf = cache.get(key)
+            record.rows = len(gdf) if gdf is not None else 0
+        if gdf is None:
+            with stage("read", self.layer_name) as record:
+                self.gdf = gpd.read_file(shapefile_path, columns=self.columns, fid_as_index=True).rename_axis(None)
+                record.rows = len(self.gdf)
+            self.preprocess(convert_crs, invalid)
+            cache.put(key, self.gdf)
+            gdf = self.gdf
+        
+        self.crs = gdf.crs
+        self.gdf = gdf
+        if mask is not None:
+            with stage("select", self.layer_name) as record:
+                self.gdf = select_near_route(gdf, mask, mask_distance)
+                record.rows = len(self.gdf)
+        
+        # Hulls are only worth computing once, so the prefilter is only used with a cache
+        if self.prefilter:
+            self.hulls = self.load_hulls(cache, cache.key(shapefile_path, crs, convert_crs, invalid, "hulls"), gdf)
+
+    def load_hulls(self, cache, key, gdf):
+        """Return the cached convex hull of every feature in ``gdf``, computing and caching them on a miss."""
+        with stage("hulls", self.layer_name) as record:
+            hulls = cache.get(key)
+            if hulls is None:
+                hulls = gpd.GeoDataFrame(geometry=shapely.convex_hull(gdf.geometry.values), index=gdf.index, crs=gdf.crs)
+                cache.put(key, hulls)
+            record.rows = len(hulls)
+        return hulls
+
+    def preprocess(self, convert_crs, invalid="repair"):
         self.gdf = self.gdf.set_crs(self.crs)
         
+        # A few distinct owners or states repeated over many rows are stored once as categories
+        categorical = {col: "category" for col in self.categorical_columns if col in self.gdf}
+        if categorical:
+            self.gdf = self.gdf.astype(categorical)
+        
         if convert_crs:
-            self.convert_crs(convert_crs) if isinstance(convert_crs, str) else self.convert_crs("EPSG:4326")
+            with stage("reproject", self.layer_name) as record:
+                self.convert_crs(convert_crs) if isinstance(convert_crs, str) else self.convert_crs("EPSG:4326")
+                record.rows = len(self.gdf)
         
         # self.gdf['geometry'] = self.gdf['geometry'].simplify(tolerance=0.01, preserve_topology=True)
-        self.gdf = self.gdf[self.gdf.is_valid]
+        with stage("validity", self.layer_name) as record:
+            self.gdf, self.repair_stats = repair_geometries(self.gdf, invalid)
+            record.rows = len(self.gdf)
+        if self.repair_stats["repaired"] or self.repair_stats["dropped"]:
+            print(f"{self.shapefile_path or type(self).__name__}: repaired {self.repair_stats['repaired']} and dropped {self.repair_stats['dropped']} invalid geometries")
 
     def convert_crs(self, crs):
         self.crs = crs
         self.gdf = self.gdf.to_crs(crs)
         
-    def get_intersection(self, linefile, cols:list=None):
-        linefile_gdf = linefile.gdf if (isinstance(linefile, LineKMZ) or isinstance(linefile, LineShapefile)) else linefile
-        try:
-            intersection = gpd.sjoin(linefile_gdf, self.gdf, predicate='intersects')
-        except:
-            self.gdf = self.gdf[self.gdf.is_valid]
-            intersection = gpd.sjoin(linefile_gdf, self.gdf, predicate='intersects',)
-        return intersection[cols] if cols else intersection
+    # Name the layer's stages are recorded under (see instrumentation.stage)
+    layer_name = "layer"
+    
+    # Attributes read from the source besides the geometry (None reads them all), and those of them
+    # with few distinct values, which are kept as categoricals
+    columns = None
+    categorical_columns = []
+    
+    # Reject join candidates whose convex hull misses the route before the exact test (see join_route)
+    prefilter = False
+    
+    # Columns added by get_intersection(measures=True): miles of route inside each feature and the
+    # mileposts where the route enters and leaves it
+    measure_cols = ["LENGTH_MI", "ENTRY_MP", "EXIT_MP"]
+    
+    def get_intersection(self, linefile, cols:list=None, corridor=None, units="ft", measures=False):
+        linefile_gdf, segments = line_parts(linefile)
+        route = linefile_gdf if segments is None else segments
+        
+        with stage("sjoin", self.layer_name) as record:
+            intersection = self.join_route(route, to_meters(corridor or 0, units))
+            if segments is not None or corridor:
+                intersection = self.merge_segments(linefile_gdf, intersection)
+            record.rows = len(intersection)
+        if measures:
+            with stage("measures", self.layer_name) as record:
+                intersection = self.get_measures(linefile_gdf, intersection, to_meters(corridor or 0, units))
+                record.rows = len(intersection)
+            cols = cols + self.measure_cols if cols else cols
+        # index_right is the matched feature, so features that share a name are still told apart
+        return intersection[cols + ["index_right"]] if cols else intersection
+    
+    def join_route(self, route, distance=0):
+        """Join route lines (or segments) against the layer; a ``distance`` in meters makes it a corridor join.
+
+        The route is transformed into the layer's CRS, so the layer itself is never reprojected, and the
+        matched rows get their original route geometry back.
+        """
+        if distance:
+            return self.get_corridor_join(route, distance)
+        local = route.to_crs(self.gdf.crs).reset_index(drop=True)
+        joined = self.prefiltered_join(local) if self.hulls is not None else gpd.sjoin(local, self.gdf, predicate='intersects')
+        rows = joined.index.to_numpy()
+        return joined.set_geometry(route.geometry.values[rows]).set_axis(route.index[rows])
+    
+    def prefiltered_join(self, route):
+        """Intersects join in two stages: against each feature's convex hull, then exactly for the pairs left.
+
+        A feature cannot intersect the route where its hull does not, and the hull has the same bounding
+        box as the feature, so the first join finds the same candidates in the same order as a direct
+        join while testing far fewer vertices. The result is identical to the direct join.
+        """
+        hulls = self.gdf.set_geometry(self.hulls.geometry.loc[self.gdf.index].to_numpy())
+        candidates = gpd.sjoin(route, hulls, predicate='intersects')
+        shapely.prepare(candidates.geometry.values)
+        exact = shapely.intersects(candidates.geometry.values, self.gdf.geometry.loc[candidates["index_right"]].values)
+        return candidates[exact]
+    
+    def get_route_pieces(self, linefile_gdf, intersection, distance=0):
+        """Return the part of the route inside each matched feature, the route it belongs to, its UTM zone
+        and the distance along the whole route to the start of that route feature.
+
+        Pieces are computed pairwise over the join result in the UTM zone of each route feature, so
+        lengths are in meters. In corridor mode the feature is widened by ``distance`` so the piece is
+        the route within the corridor of it.
+        """
+        route_zones = pd.Series(utm_zones(linefile_gdf.geometry), index=linefile_gdf.index)
+        zones = route_zones.loc[intersection.index].to_numpy()
+        index_right = intersection["index_right"].to_numpy()
+        
+        pieces = np.empty(len(intersection), dtype=object)
+        routes = np.empty(len(intersection), dtype=object)
+        for zone in np.unique(zones):
+            at = zones == zone
+            routes[at] = linefile_gdf.geometry[route_zones == zone].to_crs(epsg=zone).loc[intersection.index[at]].to_numpy()
+            features = self.gdf.geometry.loc[index_right[at]].to_crs(epsg=zone).to_numpy()
+            pieces[at] = shapely.intersection(routes[at], shapely.buffer(features, distance) if distance else features)
+        offsets = route_offsets(linefile_gdf).loc[intersection.index].to_numpy()
+        return pieces, routes, zones, offsets
+    
+    def get_measures(self, linefile_gdf, intersection, distance=0):
+        pieces, routes, _, offsets = self.get_route_pieces(linefile_gdf, intersection, distance)
+        
+        # Locate every vertex of each piece along its route; the first and last are the entry and exit
+        coords, pair = shapely.get_coordinates(pieces, return_index=True)
+        milepost = (offsets[pair] + shapely.line_locate_point(routes[pair], shapely.points(coords))) / METERS_PER_MILE
+        entry = np.full(len(pieces), np.nan)
+        exit = np.full(len(pieces), np.nan)
+        np.fmin.at(entry, pair, milepost)
+        np.fmax.at(exit, pair, milepost)
+        
+        intersection = intersection.assign(LENGTH_MI=shapely.length(pieces) / METERS_PER_MILE, ENTRY_MP=entry, EXIT_MP=exit)
+        return intersection.iloc[np.lexsort((entry, intersection.index.to_numpy()))]
+    
+    def get_corridor_join(self, route, distance):
+        """Join every feature within ``distance`` meters of ``route``, measured in the route's local UTM zone.
+
+        Candidates come from the layer's spatial index using a padded route envelope, so only features
+        near the route are reprojected before the exact ``dwithin`` test.
+        """
+        joins = []
+        zones = utm_zones(route.geometry)
+        for zone in np.unique(zones):
+            pieces = route[zones == zone]
+            rows = self.gdf.sindex.query(route_mask(pieces, self.gdf.crs, distance), predicate="intersects")
+            candidates = self.gdf.iloc[np.unique(rows)].to_crs(epsg=zone)
+            join = gpd.sjoin(pieces.to_crs(epsg=zone), candidates, predicate="dwithin", distance=distance)
+            joins.append(pd.DataFrame(join.drop(columns=join.geometry.name)))
+        return pd.concat(joins) if joins else gpd.sjoin(route, self.gdf, predicate="intersects")
+    
+    @staticmethod
+    def merge_segments(linefile_gdf, intersection):
+        """Collapse a join against route segments back to one row per original route feature and match.
+
+        The route rows come from ``linefile_gdf``, so their geometry and CRS are the original route's.
+        """
+        pairs = pd.MultiIndex.from_arrays([intersection.index, intersection["index_right"]])
+        intersection = intersection[~pairs.duplicated()]
+        if isinstance(intersection, gpd.GeoDataFrame):
+            intersection = intersection.drop(columns=intersection.geometry.name)
+        # A join against the route itself (rather than its segments) already carries the route's columns
+        intersection = intersection.drop(columns=[col for col in linefile_gdf.columns if col in intersection])
+        return linefile_gdf.join(intersection, how="inner", lsuffix="_left", rsuffix="_right")
 
     
     def list_cols(self):
@@ -98,113 +463,233 @@ class Shapefile:
     
 
 class CitiesShapefile(Shapefile):
-    def __init__(self, shapefile_path, crs="EPSG:4326", convert_crs="EPSG:4326"):
-        super().__init__(shapefile_path, crs, convert_crs)
+    layer_name = "cities"
+    columns = ["NAME", "layer"]
+    categorical_columns = ["layer"]
+    
+    def __init__(self, shapefile_path, crs="EPSG:4326", convert_crs=None, mask=None, cache=None, mask_distance=0, invalid="repair", columns=None):
+        super().__init__(shapefile_path, crs, convert_crs, mask, cache, mask_distance, invalid, columns)
         self.cols = None
         self.intersection = None
         
-    def get_intersection(self, linefile, cols:list=["NAME", "layer"]):
+    def get_intersection(self, linefile, cols:list=["NAME", "layer"], corridor=None, units="ft", measures=False):
         self.cols = cols
-        self.intersection = super().get_intersection(linefile, cols)
+        self.intersection = super().get_intersection(linefile, cols, corridor, units, measures)
         return self.intersection
 
 
 class CountiesShapefile(Shapefile):
-    def __init__(self, shapefile_path, crs="EPSG:4269", convert_crs="EPSG:4326"):
-        super().__init__(shapefile_path, crs, convert_crs)
+    layer_name = "counties"
+    columns = ["NAME", "STATEFP"]
+    categorical_columns = ["STATEFP"]
+    
+    def __init__(self, shapefile_path, crs="EPSG:4269", convert_crs=None, mask=None, cache=None, mask_distance=0, invalid="repair", columns=None):
+        super().__init__(shapefile_path, crs, convert_crs, mask, cache, mask_distance, invalid, columns)
         self.cols = None
         self.intersection = None
         
-    def get_intersection(self, linefile, cols:list=['NAME', 'STATEFP']):
+    def get_intersection(self, linefile, cols:list=['NAME', 'STATEFP'], corridor=None, units="ft", measures=False):
         self.cols = cols
-        self.intersection = super().get_intersection(linefile, cols)
-        self.intersection['STATEFP'] = self.intersection['STATEFP'].map(us_states_territories)
+        self.intersection = super().get_intersection(linefile, cols, corridor, units, measures)
+        self.intersection['STATEFP'] = map_categories(self.intersection['STATEFP'], us_states_territories)
         return self.intersection
         
       
       
 class PADUSShapefile(Shapefile):
-    def __init__(self, shapefile_path, crs="EPSG:3857", convert_crs="EPSG:4326"):
-        super().__init__(shapefile_path, crs, convert_crs)
+    layer_name = "padus"
+    columns = ["Unit_Nm"]
+    
+    # PADUS units can have hundreds of thousands of vertices, far more than their hulls
+    prefilter = True
+    
+    def __init__(self, shapefile_path, crs="EPSG:3857", convert_crs=None, mask=None, cache=None, mask_distance=0, invalid="repair", columns=None):
+        super().__init__(shapefile_path, crs, convert_crs, mask, cache, mask_distance, invalid, columns)
         self.cols = None
         self.intersection = None
         
-    def get_intersection(self, linefile, cols:list=['Unit_Nm']):
+    def get_intersection(self, linefile, cols:list=['Unit_Nm'], corridor=None, units="ft", measures=False):
         self.cols = cols
-        self.intersection = super().get_intersection(linefile, cols)
+        self.intersection = super().get_intersection(linefile, cols, corridor, units, measures)
         return self.intersection
     
 class RailShapefile(Shapefile):
-    def __init__(self, shapefile_path, crs="EPSG:3857", convert_crs="EPSG:4326"):
-        super().__init__(shapefile_path, crs, convert_crs)
+    layer_name = "rail"
+    columns = ["SUBDIV", "STATE", "RROWNER1", "TRKRGHTS1", "FRAARCID"]
+    categorical_columns = ["SUBDIV", "STATE", "RROWNER1", "TRKRGHTS1"]
+    
+    # Rail is permitted per crossing, so measures give one row per crossing point with its location
+    measure_cols = ["MILEPOST", "CROSSING_X", "CROSSING_Y"]
+    
+    def __init__(self, shapefile_path, crs="EPSG:3857", convert_crs=None, mask=None, cache=None, mask_distance=0, invalid="repair", columns=None):
+        super().__init__(shapefile_path, crs, convert_crs, mask, cache, mask_distance, invalid, columns)
         self.cols = None
         self.intersection = None
+    
+    def get_measures(self, linefile_gdf, intersection, distance=0):
+        pieces, routes, zones, offsets = self.get_route_pieces(linefile_gdf, intersection, distance)
+        
+        # Each part of the route/arc intersection is one crossing, located by its first vertex
+        parts, pair = shapely.get_parts(pieces, return_index=True)
+        points = np.where(shapely.get_type_id(parts) == 0, parts, shapely.get_point(parts, 0))
+        milepost = (offsets[pair] + shapely.line_locate_point(routes[pair], points)) / METERS_PER_MILE
         
-    def get_intersection(self, linefile, cols:list=["SUBDIV", "STATE", "RROWNER1", "TRKRGHTS1", "FRAARCID"]):
+        location = from_zones(points, zones[pair], linefile_gdf.crs)
+        crossings = intersection.iloc[pair].assign(MILEPOST=milepost, CROSSING_X=shapely.get_x(location), CROSSING_Y=shapely.get_y(location))
+        return crossings.iloc[np.lexsort((milepost, crossings.index.to_numpy()))]
+        
+    def get_intersection(self, linefile, cols:list=["SUBDIV", "STATE", "RROWNER1", "TRKRGHTS1", "FRAARCID"], corridor=None, units="ft", measures=False):
         self.cols = cols
-        self.intersection = super().get_intersection(linefile, cols)
+        self.intersection = super().get_intersection(linefile, cols, corridor, units, measures)
         return self.intersection
+    
+    def get_crossings(self, linefile, cols:list=["SUBDIV", "STATE", "RROWNER1", "TRKRGHTS1", "FRAARCID"], parallel_distance=50, min_parallel_length=500, units="ft"):
+        """Return every place the route crosses a rail arc or runs alongside one, as a point GeoDataFrame.
+
+        Crossings (KIND "crossing") are the points where the route meets an arc, located at MILEPOST.
+        Parallel runs (KIND "parallel") are stretches of at least ``min_parallel_length`` where the route
+        stays within ``parallel_distance`` of an arc; they span MILEPOST to END_MP, are LENGTH_MI long and
+        are located at their midpoint. Both distances are in ``units``. All pairs are processed with
+        vectorized operations, one batch per UTM zone.
+        """
+        linefile_gdf, segments = line_parts(linefile)
+        route = linefile_gdf if segments is None else segments
+        distance = to_meters(parallel_distance, units)
+        with stage("crossings", self.layer_name) as record:
+            pairs = self.merge_segments(linefile_gdf, self.join_route(route, distance))
+            
+            # The exact intersection's point parts are crossings; where the route lies on top of the
+            # arc the parts are lines, and those stretches show up as parallel runs instead
+            pieces, routes, zones, offsets = self.get_route_pieces(linefile_gdf, pairs)
+            parts, pair = shapely.get_parts(pieces, return_index=True)
+            point = shapely.get_type_id(parts) == 0
+            parts, pair = parts[point], pair[point]
+            crossings = pairs.iloc[pair].assign(
+                KIND="crossing",
+                MILEPOST=(offsets[pair] + shapely.line_locate_point(routes[pair], parts)) / METERS_PER_MILE,
+                END_MP=np.nan,
+                LENGTH_MI=np.nan,
+                geometry=from_zones(parts, zones[pair], linefile_gdf.crs),
+            )
+            
+            # Within the distance of the arc, long enough pieces of route are parallel runs
+            pieces, routes, zones, offsets = self.get_route_pieces(linefile_gdf, pairs, distance)
+            runs, run_pair = shapely.get_parts(pieces, return_index=True)
+            long_enough = shapely.length(runs) >= to_meters(min_parallel_length, units)
+            runs, run_pair = runs[long_enough], run_pair[long_enough]
+            ends = shapely.line_locate_point(np.repeat(routes[run_pair], 2), shapely.get_point(np.repeat(runs, 2), np.tile([0, -1], len(runs))))
+            ends = (offsets[run_pair, None] + ends.reshape(-1, 2)) / METERS_PER_MILE
+            parallels = pairs.iloc[run_pair].assign(
+                KIND="parallel",
+                MILEPOST=ends.min(axis=1),
+                END_MP=ends.max(axis=1),
+                LENGTH_MI=shapely.length(runs) / METERS_PER_MILE,
+                geometry=from_zones(shapely.line_interpolate_point(runs, 0.5, normalized=True), zones[run_pair], linefile_gdf.crs),
+            )
+            
+            crossings = pd.concat([crossings, parallels])
+            crossings = crossings.iloc[np.lexsort((crossings["MILEPOST"].to_numpy(), crossings.index.to_numpy()))]
+            record.rows = len(crossings)
+        
+        route_cols = [col for col in linefile_gdf.columns if col != linefile_gdf.geometry.name]
+        return gpd.GeoDataFrame(crossings[route_cols + cols + ["KIND", "MILEPOST", "END_MP", "LENGTH_MI", "geometry"]], geometry="geometry", crs=linefile_gdf.crs)
         
 class KMZ:
   def __init__(self, kmz_path):
     self.kmz_path = kmz_path
     
 class LineKMZ(KMZ):
-    def __init__(self, kmz_path, convert_crs="EPSG:4326"):
+    def __init__(self, kmz_path, convert_crs="EPSG:4326", segment_length=5000):
         super().__init__(kmz_path)
         
-        self.gdf = gpd.GeoDataFrame(geometry=self.extract_lines_from_kmz())
+        names = []
+        with stage("parse", "route") as record:
+            lines = self.extract_lines_from_kmz(names=names)
+            record.rows = len(lines)
+        self.gdf = gpd.GeoDataFrame({"name": names}, geometry=lines)
         
         if self.gdf.crs is None:
             self.gdf.set_crs("EPSG:4326", inplace=True)
         
         self.gdf = self.gdf.to_crs(convert_crs) if isinstance(convert_crs, str) else self.convert_crs("EPSG:4326")
+        self.segments = segment_lines(self.gdf, segment_length) if segment_length else None
         
-    def extract_lines_from_kmz(self, kmz_path=None):
-        
+    def extract_lines_from_kmz(self, kmz_path=None, names=None):
+        """Stream every LineString (including MultiGeometry parts) out of a KMZ or plain KML file.
+
+        All ``.kml`` members of a KMZ are read, in archive order. Coordinates are parsed straight into
+        one array and the lines are built in a single vectorized call. If ``names`` is a list, it is
+        filled with the Placemark name of each line.
+        """
         kmz_path = kmz_path if kmz_path else self.kmz_path
-        line_geometries = []
-        
-        with zipfile.ZipFile(kmz_path, 'r') as kmz:
-            with kmz.open('doc.kml', 'r') as kml_file:
-                k = kml.KML()
-                try:
-                    k.from_string(kml_file.read())
-                    
-                    # Recursively search for LineString or MultiLineString geometries in Placemarks
-                    def find_lines(feature):
-                        for subfeature in feature.features():
-                            if hasattr(subfeature, 'features'):
-                                find_lines(subfeature)
-                            elif subfeature.__class__.__name__ == "Placemark":
-                                geometry = subfeature.geometry
-                                if isinstance(geometry, pygeoif.geometry.LineString):
-                                    line_geometries.append(LineString(geometry.coords))
-                                elif isinstance(geometry, pygeoif.geometry.MultiLineString):
-                                    for line in geometry.geoms:
-                                        line_geometries.append(LineString(line.coords))
-
-                    for feature in k.features():
-                        find_lines(feature)
-
-                except ET.ParseError as e:
-                    print("Error parsing KML file:", e)
-                    return []
-
-        return line_geometries
+        coords, counts = [], []
+        names = [] if names is None else names
+        
+        try:
+            if zipfile.is_zipfile(kmz_path):
+                with zipfile.ZipFile(kmz_path, 'r') as kmz:
+                    for name in kmz.namelist():
+                        if name.lower().endswith('.kml'):
+                            with kmz.open(name, 'r') as kml_file:
+                                self.read_kml_lines(kml_file, coords, counts, names)
+            else:
+                with open(kmz_path, 'rb') as kml_file:
+                    self.read_kml_lines(kml_file, coords, counts, names)
+        except ET.ParseError as e:
+            print("Error parsing KML file:", e)
+            names.clear()
+            return []
+        
+        if not counts:
+            return []
+        return shapely.linestrings(np.concatenate(coords), indices=np.repeat(np.arange(len(counts)), counts))
     
-import geopandas as gpd
-from shapely.ops import unary_union
-from shapely.errors import TopologicalError
+    @staticmethod
+    def read_kml_lines(kml_file, coords, counts, names):
+        """Append the (n, 2) coordinate array, vertex count and Placemark name of each LineString in ``kml_file``."""
+        for _, elem in ET.iterparse(kml_file, events=("end",)):
+            tag = elem.tag.rsplit('}', 1)[-1]
+            if tag == "LineString":
+                text = next((child.text for child in elem if child.tag.endswith("coordinates")), None)
+                line = parse_kml_coordinates(text) if text else None
+                if line is not None and len(line) >= 2:
+                    coords.append(line)
+                    counts.append(len(line))
+                elem.clear()
+            elif tag == "Placemark":
+                name = next((child.text for child in elem if child.tag.rsplit('}', 1)[-1] == "name"), None)
+                names.extend([name] * (len(counts) - len(names)))
+                elem.clear()  # Placemarks are done once closed, so don't keep them in the tree
+
+
+def parse_kml_coordinates(text):
+    """Parse a KML ``<coordinates>`` string into an (n, 2) array of lon/lat, dropping altitude."""
+    tuples = text.split()
+    if not tuples:
+        return None
+    
+    dim = tuples[0].count(',') + 1
+    values = np.array(text.replace(',', ' ').split(), dtype=float)
+    if len(values) == dim * len(tuples):
+        return values.reshape(-1, dim)[:, :2]
+    
+    # Mixed 2D/3D tuples in one line; fall back to parsing them one at a time
+    return np.array([[float(v) for v in t.split(',')[:2]] for t in tuples])
+
 
 class LineShapefile:
-    def __init__(self, shapefile_path):
+    def __init__(self, shapefile_path, segment_length=5000):
         # Load the shapefile directly using GeoPandas
-        self.gdf = self.load_shapefile(shapefile_path)
+        with stage("read", "route") as record:
+            self.gdf = self.load_shapefile(shapefile_path)
+            record.rows = len(self.gdf)
         self.clean_geometries()  # Clean invalid geometries upon loading
+        self.segments = segment_lines(self.gdf, segment_length) if segment_length else None
 
     def load_shapefile(self, shapefile_path):
         """Load a shapefile and return a GeoDataFrame with its geometries."""
+        if isinstance(shapefile_path, gpd.GeoDataFrame):
+            return shapefile_path
         try:
             gdf = gpd.read_file(shapefile_path)
             return gdf
@@ -213,11 +698,58 @@ class LineShapefile:
         
     def clean_geometries(self):
         """Attempt to fix invalid geometries in the GeoDataFrame."""
-        self.gdf["geometry"] = self.gdf["geometry"].apply(lambda geom: geom if geom.is_valid else geom.buffer(0))
-        # Drop geometries that are still invalid
-        self.gdf = self.gdf[self.gdf.is_valid]
+        self.gdf, self.repair_stats = repair_geometries(self.gdf, "repair")
 
     @property
     def unary_union(self):
         """Return the union of all geometries in the shapefile's GeoDataFrame."""
         return self.gdf.geometry.unary_union
+
+
+ROUTE_EXTENSIONS = ('.kmz', '.kml', '.shp')
+
+class RouteSet:
+    """Several routes in one GeoDataFrame with a ``route_id`` column, so each reference layer is joined once for all of them."""
+    def __init__(self, gdf, segment_length=5000):
+        self.gdf = gdf.to_crs("EPSG:4326").reset_index(drop=True)
+        self.segments = segment_lines(self.gdf, segment_length) if segment_length else None
+    
+    @classmethod
+    def from_source(cls, source, route_id_col=None, segment_length=5000):
+        """Load routes from a directory, a list of route files, or one multi-feature file.
+
+        Files in a directory or list are one route each, identified by file name. In a single shapefile
+        the routes are identified by ``route_id_col``; in a single KMZ/KML by Placemark name.
+        """
+        if isinstance(source, (list, tuple)):
+            paths = list(source)
+        elif os.path.isdir(source):
+            paths = sorted(os.path.join(source, name) for name in os.listdir(source) if name.lower().endswith(ROUTE_EXTENSIONS))
+        else:
+            return cls(cls.load_routes(source, route_id_col), segment_length)
+        
+        if not paths:
+            raise ValueError(f"No route files ({', '.join(ROUTE_EXTENSIONS)}) found in {source}.")
+        routes = [cls.load_routes(path).assign(route_id=os.path.splitext(os.path.basename(path))[0]) for path in paths]
+        return cls(pd.concat(routes, ignore_index=True), segment_length)
+    
+    @staticmethod
+    def load_routes(path, route_id_col=None):
+        """Return the lines in ``path`` as a GeoDataFrame with a ``route_id`` column."""
+        if path.lower().endswith(('.kmz', '.kml')):
+            gdf = LineKMZ(path, segment_length=None).gdf
+            ids = gdf["name"].fillna(pd.Series([f"route_{i}" for i in range(len(gdf))], index=gdf.index))
+        elif path.lower().endswith('.shp'):
+            gdf = LineShapefile(path, segment_length=None).gdf
+            ids = gdf[route_id_col].astype(str) if route_id_col else os.path.splitext(os.path.basename(path))[0]
+        else:
+            raise ValueError("Unsupported file type for line layer. Please provide a .kmz, .kml or .shp file.")
+        return gpd.GeoDataFrame(geometry=gdf.geometry).assign(route_id=ids)
+    
+    @property
+    def route_ids(self):
+        return self.gdf["route_id"].unique().tolist()
+    
+    def lengths(self):
+        """Return the length of each route in miles, measured in each line's UTM zone."""
+        return (line_lengths(self.gdf.geometry) / METERS_PER_MILE).groupby(self.gdf["route_id"]).sum()
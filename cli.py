@@ -0,0 +1,179 @@
+import argparse
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="uterra", description="Permitting reports for fiber optic routes.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    
+    batch = commands.add_parser("batch", help="Write a report for every route and a comparison summary.")
+    batch.add_argument("routes", nargs="+", help="Route files, a directory of route files, or one multi-route KMZ/KML/shapefile.")
+    batch.add_argument("--route-id-col", help="Column identifying each route in a multi-route shapefile.")
+    batch.add_argument("--output-dir", default=".", help="Directory for the reports (default: current directory).")
+    batch.add_argument("--timings", action="store_true", help="Print the time and row count of every stage.")
+    batch.add_argument("--memory", action="store_true", help="With --timings, also trace the peak memory of every stage (several times slower).")
+    batch.add_argument("--profile", metavar="DIR", help="Write a cProfile file for every stage to DIR (best without --parallel).")
+    add_layer_arguments(batch)
+    batch.set_defaults(handler=run_batch)
+    
+    crossings = commands.add_parser("crossings", help="Write a route's rail crossing points and parallel runs to a GeoPackage.")
+    crossings.add_argument("route", help="Route KMZ/KML or shapefile.")
+    crossings.add_argument("--rail", required=True, help="Rail lines shapefile.")
+    crossings.add_argument("--output", default="rail_crossings.gpkg", help="GeoPackage to write (default: rail_crossings.gpkg).")
+    crossings.add_argument("--parallel-distance", type=float, default=50, help="Distance within which the route runs parallel to a rail line (default: 50).")
+    crossings.add_argument("--min-parallel-length", type=float, default=500, help="Shortest stretch reported as a parallel run (default: 500).")
+    crossings.add_argument("--units", default="ft", help="Units of the distances: ft, m or mi (default: ft).")
+    crossings.add_argument("--no-cache", action="store_true", help="Do not use the preprocessed layer cache.")
+    crossings.add_argument("--tiles", action="store_true", help="Read the rail layer from the partitioned store if it has been partitioned.")
+    add_invalid_argument(crossings)
+    crossings.set_defaults(handler=run_crossings)
+    
+    partition = commands.add_parser("partition", help="Split reference layers into grid tiles so routes only read the tiles they touch.")
+    partition.add_argument("--cities", help="Cities shapefile.")
+    partition.add_argument("--counties", help="Counties shapefile.")
+    partition.add_argument("--padus", help="PADUS (protected areas) shapefile.")
+    partition.add_argument("--rail", help="Rail lines shapefile.")
+    partition.add_argument("--tile-size", type=float, default=1.0, help="Tile size in degrees (default: 1.0).")
+    partition.add_argument("--tile-dir", help="Where the tiles are written (default: ~/.uterra/tiles).")
+    add_invalid_argument(partition)
+    partition.set_defaults(handler=run_partition)
+    
+    worker = commands.add_parser("worker", help="Run a resident worker that keeps layers loaded and serves reports over local HTTP.")
+    worker.add_argument("--host", default="127.0.0.1", help="Address to listen on (default: 127.0.0.1, this machine only).")
+    worker.add_argument("--port", type=int, default=8750, help="Port to listen on (default: 8750).")
+    worker.add_argument("--max-jobs", type=int, default=1, help="Reports run at once; the rest are queued (default: 1).")
+    worker.add_argument("--job-ttl", type=float, default=3600, help="Seconds a finished job's state and report are kept (default: 3600).")
+    worker.add_argument("--max-finished-jobs", type=int, default=100, help="Finished jobs kept at most; older ones are forgotten first (default: 100).")
+    worker.add_argument("--cities", help="Cities shapefile to load at startup.")
+    worker.add_argument("--counties", help="Counties shapefile to load at startup.")
+    worker.add_argument("--padus", help="PADUS (protected areas) shapefile to load at startup.")
+    worker.add_argument("--rail", help="Rail lines shapefile to load at startup.")
+    worker.add_argument("--store", action="store_true", help="Keep join results per route segment, so edited routes only rejoin what changed.")
+    worker.add_argument("--tiles", action="store_true", help="Read layers from the partitioned store if they have been partitioned.")
+    worker.set_defaults(handler=run_worker)
+    
+    benchmark = commands.add_parser("benchmark", help="Time each pipeline stage on synthetic national-scale data.")
+    benchmark.add_argument("--scale", type=float, default=1.0, help="Multiplier on the synthetic feature counts (default: 1.0).")
+    benchmark.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data (default: 0).")
+    benchmark.add_argument("--data-dir", help="Where the synthetic data is generated and reused (default: ~/.uterra/benchmark/<scale>-<seed>).")
+    benchmark.add_argument("--repeat", type=int, default=1, help="Run the pipeline this many times and keep the best time per stage.")
+    benchmark.add_argument("--full-read", action="store_true", help="Read whole layers instead of only the features near the route.")
+    benchmark.add_argument("--corridor", type=float, help="Include features within this distance of the route.")
+    benchmark.add_argument("--units", default="ft", help="Units of --corridor: ft, m or mi (default: ft).")
+    benchmark.add_argument("--measures", action="store_true", help="Add crossing lengths and mileposts.")
+    benchmark.add_argument("--parallel", action="store_true", help="Process the reference layers concurrently.")
+    benchmark.add_argument("--no-cache", action="store_true", help="Do not use a layer cache (by default one is kept in the data directory, cold on the first run).")
+    benchmark.add_argument("--tiles", action="store_true", help="Read layers from tiles partitioned into the data directory.")
+    add_invalid_argument(benchmark)
+    benchmark.add_argument("--output", help="Write the results as JSON to this file instead of printing them.")
+    benchmark.add_argument("--imports", action="store_true", help="Only measure the plugin's import time at QGIS startup against its budget.")
+    benchmark.set_defaults(handler=run_benchmark)
+    
+    return parser
+
+def add_layer_arguments(parser):
+    parser.add_argument("--cities", help="Cities shapefile.")
+    parser.add_argument("--counties", help="Counties shapefile.")
+    parser.add_argument("--padus", help="PADUS (protected areas) shapefile.")
+    parser.add_argument("--rail", help="Rail lines shapefile.")
+    parser.add_argument("--corridor", type=float, help="Include features within this distance of the route.")
+    parser.add_argument("--units", default="ft", help="Units of --corridor: ft, m or mi (default: ft).")
+    parser.add_argument("--measures", action="store_true", help="Add crossing lengths and mileposts.")
+    parser.add_argument("--parallel", action="store_true", help="Process the reference layers concurrently.")
+    parser.add_argument("--no-cache", action="store_true", help="Do not use the preprocessed layer cache.")
+    parser.add_argument("--tiles", action="store_true", help="Read layers from the partitioned store if they have been partitioned (see partition).")
+    parser.add_argument("--api-key", help="OpenAI API key; adds an LLM permitting summary to each report.")
+    add_invalid_argument(parser)
+
+def add_invalid_argument(parser):
+    parser.add_argument("--invalid", choices=["repair", "drop", "fail"], default="repair",
+                        help="What to do with invalid geometries in the reference layers: repair them, drop them, or stop with an error (default: repair).")
+
+def run_batch(args):
+    from .cache import default_cache
+    from .tiles import default_tiles
+    from .instrumentation import RunStats
+    from .permits import get_batch_permit_summary
+    
+    stats = RunStats(memory=args.memory, profile_dir=args.profile) if args.timings or args.profile else None
+    summary = get_batch_permit_summary(
+        args.routes[0] if len(args.routes) == 1 else args.routes,
+        cities_path=args.cities,
+        counties_path=args.counties,
+        padus_path=args.padus,
+        rail_path=args.rail,
+        output_dir=args.output_dir,
+        route_id_col=args.route_id_col,
+        use_llm=args.api_key is not None,
+        api_key=args.api_key,
+        cache=None if args.no_cache else default_cache(),
+        parallel=args.parallel,
+        corridor=args.corridor,
+        units=args.units,
+        measures=args.measures,
+        stats=stats,
+        tiles=default_tiles() if args.tiles else None,
+        invalid=args.invalid,
+    )
+    print(summary.to_string(index=False))
+    if args.timings:
+        print(f"\n{stats}\nTotal: {stats.total_seconds:.3f} s")
+
+def run_crossings(args):
+    from .cache import default_cache
+    from .permits import get_rail_crossings, load_route, summarize_crossings, write_crossings
+    from .tiles import default_tiles
+    
+    crossings = get_rail_crossings(args.rail, load_route(args.route), cache=None if args.no_cache else default_cache(),
+                                   parallel_distance=args.parallel_distance, min_parallel_length=args.min_parallel_length, units=args.units,
+                                   tiles=default_tiles() if args.tiles else None, invalid=args.invalid)
+    write_crossings(crossings, args.output)
+    print(summarize_crossings(crossings).to_string(index=False))
+
+def run_partition(args):
+    from .classes import CitiesShapefile, CountiesShapefile, PADUSShapefile, RailShapefile
+    from .tiles import DEFAULT_TILE_DIR, TileStore
+    
+    tiles = TileStore(args.tile_dir or DEFAULT_TILE_DIR, args.tile_size)
+    layers = {CitiesShapefile: args.cities, CountiesShapefile: args.counties, PADUSShapefile: args.padus, RailShapefile: args.rail}
+    if not any(layers.values()):
+        raise SystemExit("partition: give at least one of --cities, --counties, --padus or --rail")
+    for layer_class, path in layers.items():
+        if path:
+            tiles.build(layer_class, path, invalid=args.invalid)
+
+def run_worker(args):
+    from .worker import Worker
+    
+    preload = {"cities": args.cities, "counties": args.counties, "padus": args.padus, "rail": args.rail}
+    Worker(args.max_jobs, preload, store=args.store, tiles=args.tiles, job_ttl=args.job_ttl, max_finished_jobs=args.max_finished_jobs).serve(args.host, args.port)
+
+def run_benchmark(args):
+    import json
+    import os
+    from .benchmark import STARTUP_BUDGET, check_startup, generate_datasets, measure_imports, run_benchmark, write_results
+    
+    if args.imports:
+        imports = measure_imports()
+        for module, result in imports.items():
+            print(f"{module}: {result['error']}" if "error" in result else f"{module}: {result['seconds']:.3f} s, heavy imports: {', '.join(result['heavy']) or 'none'}")
+        problems = check_startup(imports)
+        print("\n".join(problems) if problems else f"Startup imports are within the {STARTUP_BUDGET:.3f} s budget")
+        if problems:
+            raise SystemExit(1)
+        return
+    
+    data_dir = args.data_dir or os.path.join(os.path.expanduser("~"), ".uterra", "benchmark", f"{args.scale:g}-{args.seed}")
+    paths = generate_datasets(data_dir, args.scale, args.seed)
+    results = run_benchmark(paths, args.repeat, bounded_read=not args.full_read,
+                            cache_dir=None if args.no_cache else os.path.join(data_dir, "layer_cache"),
+                            tile_dir=os.path.join(data_dir, "tiles") if args.tiles else None,
+                            corridor=args.corridor, units=args.units, measures=args.measures, parallel=args.parallel, invalid=args.invalid)
+    results["scale"] = args.scale
+    if args.output:
+        write_results(results, args.output)
+    else:
+        print(json.dumps(results, indent=2))
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
@@ -0,0 +1,143 @@
+import contextvars
+import cProfile
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+# The RunStats collecting stages in the current run; ThreadPoolExecutor tasks need copy_context() to see it
+_current_stats = contextvars.ContextVar("uterra_run_stats", default=None)
+
+
+class StageRecord:
+    """Wall time, peak traced memory and output row count of one pipeline stage."""
+    def __init__(self, stage, layer=None):
+        self.stage = stage
+        self.layer = layer
+        self.seconds = None
+        self.peak_bytes = None
+        self.rows = None
+
+    @property
+    def name(self):
+        return f"{self.layer}.{self.stage}" if self.layer else self.stage
+
+    def to_dict(self):
+        return {"layer": self.layer, "stage": self.stage, "seconds": self.seconds, "peak_bytes": self.peak_bytes, "rows": self.rows}
+
+    def __str__(self):
+        parts = [f"{self.name}: {self.seconds:.3f} s"]
+        if self.rows is not None:
+            parts.append(f"{self.rows} rows")
+        if self.peak_bytes is not None:
+            parts.append(f"peak {self.peak_bytes / 2**20:.1f} MiB")
+        return ", ".join(parts)
+
+
+class RunStats:
+    """Stage-by-stage timings of a report run.
+
+    Pass one to get_permit_summary (or activate it around other calls) and every instrumented stage
+    appends a StageRecord to ``records``. With ``memory``, peak memory is traced with tracemalloc,
+    which counts Python and NumPy allocations but not GDAL or GEOS internals. Tracing covers every
+    thread in the process and makes a run several times slower, so it is off by default; stages that
+    overlap in a parallel run share one peak. With ``profile_dir``, each stage also writes a cProfile file there.
+    ``on_stage`` is called with each record as soon as its stage finishes.
+    """
+    def __init__(self, memory=False, profile_dir=None, on_stage=None):
+        self.memory = memory
+        self.profile_dir = profile_dir
+        self.on_stage = on_stage
+        self.records = []
+        self.total_seconds = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        """Collect the stages run inside this block, in this thread and in tasks started with its context.
+
+        A RunStats can be activated more than once; ``total_seconds`` adds up the time spent in each block.
+        """
+        started_tracing = self.memory and not tracemalloc.is_tracing()
+        if started_tracing:
+            tracemalloc.start()
+        if self.profile_dir:
+            os.makedirs(self.profile_dir, exist_ok=True)
+
+        token = _current_stats.set(self)
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            self.total_seconds = (self.total_seconds or 0) + time.perf_counter() - start
+            _current_stats.reset(token)
+            if started_tracing:
+                tracemalloc.stop()
+
+    def add(self, record):
+        with self._lock:
+            self.records.append(record)
+        if self.on_stage:
+            self.on_stage(record)
+
+    def to_frame(self):
+        import pandas as pd  # The plugin imports this module at QGIS startup, so pandas is loaded on first use
+        
+        return pd.DataFrame([record.to_dict() for record in self.records], columns=["layer", "stage", "seconds", "peak_bytes", "rows"])
+
+    def to_dict(self):
+        return {"total_seconds": self.total_seconds, "stages": [record.to_dict() for record in self.records]}
+
+    def to_markdown(self):
+        lines = ["| Stage | Time (s) | Peak memory (MiB) | Rows |", "|---|---|---|---|"]
+        for record in self.records:
+            peak = f"{record.peak_bytes / 2**20:.1f}" if record.peak_bytes is not None else "n/a"
+            rows = record.rows if record.rows is not None else "n/a"
+            lines.append(f"| {record.name} | {record.seconds:.3f} | {peak} | {rows} |")
+        if self.total_seconds is not None:
+            lines.append(f"\nTotal: {self.total_seconds:.3f} s")
+        return "\n".join(lines) + "\n"
+
+    def __str__(self):
+        return "\n".join(str(record) for record in self.records)
+
+
+@contextmanager
+def stage(name, layer=None):
+    """Time the block as stage ``name`` of ``layer``; set ``rows`` on the yielded record to count its output.
+
+    Does nothing beyond yielding a record when no RunStats is active, so stages cost nothing in normal runs.
+    """
+    record = StageRecord(name, layer)
+    stats = _current_stats.get()
+    if stats is None:
+        yield record
+        return
+
+    tracing = stats.memory and tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+    profiler = _start_profiler() if stats.profile_dir else None
+
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record.seconds = time.perf_counter() - start
+        if tracing:
+            record.peak_bytes = max(tracemalloc.get_traced_memory()[1] - base, 0)
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(os.path.join(stats.profile_dir, f"{len(stats.records):03d}_{record.name}.prof"))
+        stats.add(record)
+
+def _start_profiler():
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        return None  # Another stage is already being profiled in a parallel thread
+    return profiler
@@ -0,0 +1,211 @@
+import asyncio
+import random
+import re
+
+import openai
+
+from .instrumentation import stage
+
+
+DEFAULT_MODEL = "gpt-4o"
+
+# Part of the guidance cache key; bump it whenever the prompts change so old guidance is not reused
+PROMPT_VERSION = 1
+
+SYSTEM_PROMPT = "You are a permitting specialist for long-haul fiber optic installations, responsible for ensuring only verified and working websites are referenced for permitting and regulatory information."
+
+# One request per report section; each gets only its own layer's intersections
+SECTIONS = {
+    "cities": ("Cities", "List each city that the installation route intersects, detailing the specific permitting departments or agencies to contact, along with relevant URLs for each department's main or permitting page. Provide essential contact information, including emails or phone numbers where available."),
+    "counties": ("Counties", "List each intersecting county along the route, noting any specific considerations such as local regulations, environmental restrictions, or zoning requirements. Include relevant county permitting agencies with URLs and contact details. Provide links to official directories or permitting portals when direct URLs are unavailable. Prioritize verified links to main pages or high-level directories of official government and regulatory websites. Avoid creating specific URLs that may not exist; if a specific permit page isnt known, provide the main website link."),
+    "padus": ("Protected Areas (PADUS)", "Identify each protected area crossed, specifying the name and type (e.g., national forest, wildlife refuge, recreation area). Provide guidance on necessary permits or special permissions required for these lands, along with contacts and URLs for the respective federal, state, or local agencies that manage these areas. Emphasize any considerations for environmental impact, protected species, or cultural sites."),
+    "rail": ("Railway Crossings", "For each railway segment that the route intersects, detail the rail company (e.g., 'Owner: X') and provide essential contacts for obtaining crossing permits. Include any additional details like track rights, subdivision information, and any FRA-related identifiers, where available. If known, specify any unique procedural steps or fees related to the crossing permits."),
+}
+
+
+class IncompleteStreamError(Exception):
+    """Raised when a response stream ends before the model reported why it finished."""
+
+
+# Columns that identify a jurisdiction in each section; guidance is generated and cached per jurisdiction
+JURISDICTION_COLUMNS = {
+    "cities": ["NAME"],
+    "counties": ["NAME", "STATEFP"],
+    "padus": ["Unit_Nm"],
+    "rail": ["RROWNER1"],
+}
+
+# Failures worth another attempt; anything else (bad key, bad request) fails the section at once
+RETRYABLE_ERRORS = (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError, IncompleteStreamError)
+
+
+def jurisdictions(section, intersections):
+    """Return the distinct jurisdictions in a section's intersections, in route order, as labels like "Salt Lake, Utah"."""
+    cols = [col for col in JURISDICTION_COLUMNS[section] if col in intersections]
+    labels = intersections[cols].astype(object).fillna("").astype(str).agg(", ".join, axis=1).str.strip(", ")
+    return list(dict.fromkeys(label for label in labels if label))
+
+def section_prompt(section, labels):
+    title, instructions = SECTIONS[section]
+    headings = "\n".join(f"### {label}" for label in labels)
+    return f"""I am conducting a long-haul fiber optic installation across multiple states and jurisdictions. Please write the **{title}** section of a permitting report for it.
+
+{instructions}
+
+Provide details as bullet points or structured lists for easy reading, and prioritize clarity and accessibility of contact information and URLs. If information is unavailable, indicate 'information not found.' Be sure to provide working links where you can.
+
+Write general permitting guidance for each of the following, under exactly these headings and in this order, with nothing before the first heading:
+{headings}"""
+
+def split_guidance(text, labels):
+    """Split a response into ``{label: guidance}`` at its ``### label`` headings; unknown headings are skipped."""
+    parts = re.split(r"^### +(.+?) *$", text, flags=re.MULTILINE)
+    known = set(labels)
+    return {label: f"### {label}\n{body.strip()}\n\n" for label, body in zip(parts[1::2], parts[2::2]) if label in known}
+
+
+def ai_section_summary(api_key, cities, counties, padus, rail, file=None, model=DEFAULT_MODEL, base_url=None, max_concurrency=4, retries=3, backoff=1.0, timeout=120, guidance_cache=None):
+    """Generate the LLM report one section per request, with up to ``max_concurrency`` requests in flight.
+
+    Sections are written to ``file`` (an open text file) in report order as their responses stream in:
+    the first unfinished section is written live and later ones are buffered until it completes.
+    Connection errors, rate limits and server errors are retried ``retries`` times with exponential
+    ``backoff``; a section that still fails gets an error note instead of failing the whole report.
+    ``base_url`` points the client at another OpenAI-compatible server. With a GuidanceCache, only
+    jurisdictions without cached guidance are sent to the API. Returns the full report text.
+    """
+    layers = {"cities": cities, "counties": counties, "padus": padus, "rail": rail}
+    writer = SectionWriter(file, [SECTIONS[name][0] for name in layers])
+    requests = []
+    for position, (name, intersections) in enumerate(layers.items()):
+        if intersections is None:
+            writer.write(position, f"{SECTIONS[name][0]} information was not provided.\n")
+            writer.finish(position)
+            continue
+        
+        labels = jurisdictions(name, intersections)
+        cached = guidance_cache.get(name, labels, model, PROMPT_VERSION) if guidance_cache else {}
+        missing = [label for label in labels if label not in cached]
+        cached_text = "".join(cached[label] for label in labels if label in cached)
+        if not missing:
+            writer.write(position, cached_text or f"The route does not intersect any {SECTIONS[name][0].lower()}.\n")
+            writer.finish(position)
+            continue
+        requests.append((position, name, missing, cached_text))
+
+    async def generate():
+        client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url, timeout=timeout, max_retries=0)
+        semaphore = asyncio.Semaphore(max_concurrency)
+        try:
+            await asyncio.gather(*(
+                _stream_section(client, semaphore, writer, position, model, section_prompt(name, missing), retries, backoff, cached_text)
+                for position, name, missing, cached_text in requests
+            ))
+        finally:
+            await client.close()
+
+    with stage("llm") as record:
+        if requests:
+            asyncio.run(generate())
+        record.rows = len(requests)
+    
+    if guidance_cache:
+        for position, name, missing, cached_text in requests:
+            guidance_cache.put(name, split_guidance(writer.generated(position), missing), model, PROMPT_VERSION)
+    return writer.text()
+
+async def _stream_section(client, semaphore, writer, position, model, prompt, retries, backoff, cached_text=""):
+    async with semaphore:
+        for attempt in range(retries + 1):
+            # Cached guidance goes first; the streamed response follows it
+            writer.restart(position)
+            writer.write(position, cached_text, generated=False)
+            try:
+                stream = await client.chat.completions.create(
+                    model=model,
+                    messages=[{"role": "system", "content": SYSTEM_PROMPT}, {"role": "user", "content": prompt}],
+                    stream=True,
+                )
+                finish_reason = None
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        writer.write(position, chunk.choices[0].delta.content)
+                    if chunk.choices and chunk.choices[0].finish_reason:
+                        finish_reason = chunk.choices[0].finish_reason
+                if finish_reason is None:
+                    raise IncompleteStreamError("the response stream was cut off")
+                break
+            except RETRYABLE_ERRORS as e:
+                if attempt == retries:
+                    writer.fail(position, cached_text, e)
+                    break
+                await asyncio.sleep(backoff * 2**attempt * random.uniform(0.5, 1.5))
+            except openai.OpenAIError as e:
+                writer.fail(position, cached_text, e)
+                break
+        writer.finish(position)
+
+
+class SectionWriter:
+    """Writes concurrently generated sections to a file in order, streaming the earliest unfinished one.
+
+    All calls come from the event loop thread, so no locking is needed.
+    """
+    def __init__(self, file, titles):
+        self.file = file
+        self.titles = titles
+        self.chunks = [[] for _ in titles]
+        self.generated_chunks = [[] for _ in titles]  # Just the text that came from the model
+        self.done = [False] * len(titles)
+        self.current = 0  # The section being written to the file
+        self.start = None  # File offset where the current section's text begins
+        self._begin_current()
+
+    def write(self, position, text, generated=True):
+        if not text:
+            return
+        self.chunks[position].append(text)
+        if generated:
+            self.generated_chunks[position].append(text)
+        if position == self.current and self.file is not None:
+            self.file.write(text)
+            self.file.flush()
+
+    def restart(self, position):
+        """Discard what a section has produced so far, so a retried request starts it afresh."""
+        if not self.chunks[position]:
+            return
+        self.chunks[position] = []
+        self.generated_chunks[position] = []
+        if position == self.current and self.file is not None:
+            self.file.seek(self.start)
+            self.file.truncate()
+
+    def fail(self, position, cached_text, error):
+        """Replace a section's partial response with a note, keeping any cached guidance."""
+        self.restart(position)
+        self.write(position, cached_text, generated=False)
+        self.write(position, f"_Guidance for the remaining {self.titles[position].lower()} could not be generated: {error}_\n", generated=False)
+
+    def generated(self, position):
+        return "".join(self.generated_chunks[position])
+
+    def finish(self, position):
+        self.done[position] = True
+        while self.current < len(self.titles) and self.done[self.current]:
+            if self.file is not None:
+                self.file.write("\n\n")
+            self.current += 1
+            self._begin_current()
+
+    def text(self):
+        return "".join(f"## {title}\n\n{''.join(chunks)}\n\n" for title, chunks in zip(self.titles, self.chunks))
+
+    def _begin_current(self):
+        if self.file is None or self.current >= len(self.titles):
+            return
+        self.file.write(f"## {self.titles[self.current]}\n\n")
+        self.start = self.file.tell()
+        # Anything this section buffered while an earlier one was streaming goes out now
+        self.file.write("".join(self.chunks[self.current]))
+        self.file.flush()
@@ -1,38 +1,261 @@
-from .classes import CitiesShapefile, CountiesShapefile, PADUSShapefile, RailShapefile, LineKMZ, LineShapefile
-import openai
+from .classes import CitiesShapefile, CountiesShapefile, PADUSShapefile, RailShapefile, LineKMZ, LineShapefile, RouteSet, line_parts, segment_lines, to_meters
+from .cache import NO_MATCH, source_key
+from .instrumentation import RunStats, stage
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import geopandas as gpd
+import numpy as np
+import pandas as pd
 import os
+import pyogrio
+import re
+import time
 
-def get_cities_intersection(shapefile_path, linefile, cols:list=["NAME", "layer"]):
-    cities = CitiesShapefile(shapefile_path)
-    return cities.get_intersection(linefile, cols)
 
-def get_counties_intersection(shapefile_path, linefile, cols:list=['NAME', 'STATEFP']):
-    counties = CountiesShapefile(shapefile_path)
-    return counties.get_intersection(linefile, cols)
+class LayerIntersectionError(Exception):
+    """Raised when one or more reference layers fail in a parallel run; ``errors`` maps layer name to exception."""
+    def __init__(self, errors):
+        self.errors = errors
+        super().__init__("; ".join(f"{layer}: {error}" for layer, error in errors.items()))
 
-def get_padus_intersection(shapefile_path, linefile, cols=['Unit_Nm']):
-    padus = PADUSShapefile(shapefile_path)
-    return padus.get_intersection(linefile, cols)
 
-def get_rail_intersection(shapefile_path, linefile, cols:list=["SUBDIV", "STATE", "RROWNER1", "TRKRGHTS1", "FRAARCID"]):
-    rail = RailShapefile(shapefile_path)
-    return rail.get_intersection(linefile, cols)
+def open_layer(layer_class, shapefile_path, mask=None, cache=None, mask_distance=0, tiles=None, columns=None, invalid="repair"):
+    """Open a reference layer, reading only the tiles near ``mask`` when it has been partitioned into ``tiles`` (a TileStore).
 
-def identify_permitting_locations(line_path, cities_shapefile, counties_shapefile, padus_shapefile=None, rail_shapefile=None):
-    if line_path.lower().endswith('.kmz'):
-        linefile = LineKMZ(line_path)
+    Only ``columns`` (by default the layer's own ``columns``) are read besides the geometry. ``invalid``
+    is how invalid geometries are handled: "repair", "drop" or "fail" (see repair_geometries).
+    """
+    if tiles is not None and isinstance(shapefile_path, str):
+        gdf = tiles.load(layer_class, shapefile_path, mask, mask_distance, columns, invalid)
+        if gdf is not None:
+            return layer_class(gdf, convert_crs=False, mask=mask, mask_distance=mask_distance, invalid=invalid, columns=columns)
+    return layer_class(shapefile_path, mask=mask, cache=cache, mask_distance=mask_distance, invalid=invalid, columns=columns)
+
+def load_layer(layer_class, shapefile_path, linefile, bounded_read: bool=True, cache=None, corridor=None, units="ft", store=None, tiles=None, columns=None, invalid="repair"):
+    """Load a reference layer for ``linefile``, with only ``columns`` besides the geometry and invalid geometries handled as ``invalid``.
+
+    With a ResultStore, only route segments that are not in the store yet are joined against the
+    source layer, and the returned layer holds just the features the route's segments matched.
+    With a TileStore, layers that have been partitioned are read from the tiles the route touches.
+    """
+    mask_distance = to_meters(corridor or 0, units)
+    # In-memory layers have no file to version their stored results against
+    if store is None or isinstance(shapefile_path, gpd.GeoDataFrame):
+        return open_layer(layer_class, shapefile_path, linefile if bounded_read else None, cache, mask_distance, tiles, columns, invalid)
+    
+    linefile_gdf, segments = line_parts(linefile)
+    segments = segment_lines(linefile_gdf) if segments is None else segments
+    hashes = store.segment_hashes(segments)
+    version = source_key(shapefile_path, layer_class.__name__, mask_distance, columns or layer_class.columns, invalid)
+    with stage("store", layer_class.layer_name) as record:
+        pairs, features = store.load(version)
+        record.rows = len(pairs)
+    
+    new = ~pd.Series(hashes).isin(pairs["segment"]).to_numpy()
+    if new.any():
+        changed = gpd.GeoDataFrame(geometry=segments.geometry.values[new], crs=segments.crs)
+        layer = open_layer(layer_class, shapefile_path, changed if bounded_read else None, cache, mask_distance, tiles, columns, invalid)
+        joined = layer.join_route(changed, mask_distance)
+        unmatched = np.setdiff1d(hashes[new], hashes[new][joined.index])
+        pairs = pd.concat([
+            pairs,
+            pd.DataFrame({"segment": hashes[new][joined.index], "index_right": joined["index_right"].to_numpy()}),
+            pd.DataFrame({"segment": unmatched, "index_right": NO_MATCH}),
+        ], ignore_index=True)
+        matched = layer.gdf.loc[np.unique(joined["index_right"])]
+        features = matched if features is None else pd.concat([features, matched[~matched.index.isin(features.index)]])
+    
+    if features is None:
+        # Nothing has been joined against this layer version yet, e.g. for an empty route
+        empty = gpd.GeoDataFrame(columns=columns or layer_class.columns or [], geometry=gpd.GeoSeries(crs=pyogrio.read_info(shapefile_path)["crs"]))
+        return layer_class(empty, convert_crs=False, invalid=invalid, columns=columns)
+    
+    current = pairs["segment"].isin(hashes)
+    pairs.loc[current, "used"] = time.time()
+    store.save(version, pairs, features)
+    
+    ids = pairs.loc[current & (pairs["index_right"] != NO_MATCH), "index_right"].unique()
+    return layer_class(features.loc[np.sort(ids)], convert_crs=False, invalid=invalid, columns=columns)
+
+def get_cities_intersection(shapefile_path, linefile, cols:list=["NAME", "layer"], bounded_read: bool=True, cache=None, corridor=None, units="ft", measures: bool=False, store=None, tiles=None, invalid="repair"):
+    cities = load_layer(CitiesShapefile, shapefile_path, linefile, bounded_read, cache, corridor, units, store, tiles, cols, invalid)
+    return cities.get_intersection(linefile, cols, corridor, units, measures)
+
+def get_counties_intersection(shapefile_path, linefile, cols:list=['NAME', 'STATEFP'], bounded_read: bool=True, cache=None, corridor=None, units="ft", measures: bool=False, store=None, tiles=None, invalid="repair"):
+    counties = load_layer(CountiesShapefile, shapefile_path, linefile, bounded_read, cache, corridor, units, store, tiles, cols, invalid)
+    return counties.get_intersection(linefile, cols, corridor, units, measures)
+
+def get_padus_intersection(shapefile_path, linefile, cols=['Unit_Nm'], bounded_read: bool=True, cache=None, corridor=None, units="ft", measures: bool=False, store=None, tiles=None, invalid="repair"):
+    padus = load_layer(PADUSShapefile, shapefile_path, linefile, bounded_read, cache, corridor, units, store, tiles, cols, invalid)
+    return padus.get_intersection(linefile, cols, corridor, units, measures)
+
+def get_rail_intersection(shapefile_path, linefile, cols:list=["SUBDIV", "STATE", "RROWNER1", "TRKRGHTS1", "FRAARCID"], bounded_read: bool=True, cache=None, corridor=None, units="ft", measures: bool=False, store=None, tiles=None, invalid="repair"):
+    rail = load_layer(RailShapefile, shapefile_path, linefile, bounded_read, cache, corridor, units, store, tiles, cols, invalid)
+    return rail.get_intersection(linefile, cols, corridor, units, measures)
+
+def get_rail_crossings(shapefile_path, linefile, cols:list=["SUBDIV", "STATE", "RROWNER1", "TRKRGHTS1", "FRAARCID"], bounded_read: bool=True, cache=None, parallel_distance=50, min_parallel_length=500, units="ft", tiles=None, invalid="repair"):
+    """Return the route's rail crossing points and parallel runs as a point GeoDataFrame (see RailShapefile.get_crossings)."""
+    rail = load_layer(RailShapefile, shapefile_path, linefile, bounded_read, cache, parallel_distance, units, tiles=tiles, columns=cols, invalid=invalid)
+    return rail.get_crossings(linefile, cols, parallel_distance, min_parallel_length, units)
+
+def summarize_crossings(crossings, by:list=["RROWNER1", "SUBDIV"]):
+    """Count the crossings and parallel runs of each rail owner and subdivision, largest first."""
+    crossing = crossings["KIND"] == "crossing"
+    return crossings.assign(
+        CROSSINGS=crossing.astype(int),
+        PARALLEL_RUNS=(~crossing).astype(int),
+        PARALLEL_MI=crossings["LENGTH_MI"].where(~crossing, 0),
+    ).groupby(by, dropna=False, observed=True)[["CROSSINGS", "PARALLEL_RUNS", "PARALLEL_MI"]].sum().reset_index().sort_values(
+        ["CROSSINGS", "PARALLEL_MI"], ascending=False, ignore_index=True)
+
+def write_crossings(crossings, output_path="rail_crossings.gpkg", by:list=["RROWNER1", "SUBDIV"]):
+    """Write the crossings to a GeoPackage as the point layer "rail_crossings", with the per-owner counts as the table "rail_owners"."""
+    crossings.to_file(output_path, layer="rail_crossings", driver="GPKG")
+    pyogrio.write_dataframe(summarize_crossings(crossings, by), output_path, layer="rail_owners", driver="GPKG")
+    print(f"Rail crossings saved to {output_path}")
+
+def load_route(line_path):
+    # The route can be a file path or a GeoDataFrame already in memory
+    if isinstance(line_path, gpd.GeoDataFrame):
+        if line_path.empty:
+            raise ValueError("The line layer has no features.")
+        return LineShapefile(line_path)
+    elif line_path.lower().endswith(('.kmz', '.kml')):
+        return LineKMZ(line_path)
     elif line_path.lower().endswith('.shp'):
-        linefile = LineShapefile(line_path)
+        return LineShapefile(line_path)
     else:
-        raise ValueError("Unsupported file type for line layer. Please provide a .kmz or .shp file.")
+        raise ValueError("Unsupported file type for line layer. Please provide a .kmz, .kml or .shp file.")
+
+def identify_permitting_locations(line_path, cities_shapefile, counties_shapefile, padus_shapefile=None, rail_shapefile=None, bounded_read: bool=True, cache=None, parallel: bool=False, max_workers: int=4, corridor=None, units="ft", measures: bool=False, store=None, tiles=None, invalid="repair"):
+    # The route and the reference layers can each be a file path or a GeoDataFrame already in memory
+    linefile = load_route(line_path)
+    return intersect_layers(linefile, cities_shapefile, counties_shapefile, padus_shapefile, rail_shapefile, parallel, max_workers,
+                            bounded_read=bounded_read, cache=cache, corridor=corridor, units=units, measures=measures, store=store, tiles=tiles, invalid=invalid)
 
-    cities = get_cities_intersection(cities_shapefile, linefile) if cities_shapefile else None
-    counties = get_counties_intersection(counties_shapefile, linefile) if counties_shapefile else None
-    padus = get_padus_intersection(padus_shapefile, linefile) if padus_shapefile else None
-    rail = get_rail_intersection(rail_shapefile, linefile) if rail_shapefile else None
+def intersect_layers(linefile, cities_shapefile, counties_shapefile, padus_shapefile=None, rail_shapefile=None, parallel: bool=False, max_workers: int=4, **options):
+    # Options are shared by every layer: bounded_read, cache, corridor (distance either side of the
+    # route, in units), measures (crossing lengths and mileposts), store (incremental re-runs), tiles
+    # (partitioned layers) and invalid (repair, drop or fail on invalid geometries)
+    if parallel:
+        return _identify_parallel(linefile, cities_shapefile, counties_shapefile, padus_shapefile, rail_shapefile, options, max_workers)
+
+    cities = get_cities_intersection(cities_shapefile, linefile, **options) if _has_layer(cities_shapefile) else None
+    counties = get_counties_intersection(counties_shapefile, linefile, **options) if _has_layer(counties_shapefile) else None
+    padus = get_padus_intersection(padus_shapefile, linefile, **options) if _has_layer(padus_shapefile) else None
+    rail = get_rail_intersection(rail_shapefile, linefile, **options) if _has_layer(rail_shapefile) else None
     return cities, counties, padus, rail
 
-def write_report(report_content, cities, counties, padus, rail, output_path="permit_report.md"):
+def _identify_parallel(linefile, cities_shapefile, counties_shapefile, padus_shapefile, rail_shapefile, options, max_workers):
+    # GDAL reads, PROJ transforms and GEOS predicates release the GIL, so threads overlap the four layers.
+    # Each task runs in a copy of this context, so the stages it records reach the active RunStats
+    layers = {
+        "cities": (get_cities_intersection, cities_shapefile),
+        "counties": (get_counties_intersection, counties_shapefile),
+        "padus": (get_padus_intersection, padus_shapefile),
+        "rail": (get_rail_intersection, rail_shapefile),
+    }
+    results = dict.fromkeys(layers)
+    errors = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            name: executor.submit(contextvars.copy_context().run, get_intersection, shapefile_path, linefile, **options)
+            for name, (get_intersection, shapefile_path) in layers.items() if _has_layer(shapefile_path)
+        }
+        for name, future in futures.items():
+            try:
+                results[name] = future.result()
+            except Exception as e:
+                errors[name] = e
+    
+    if errors:
+        raise LayerIntersectionError(errors)
+    return results["cities"], results["counties"], results["padus"], results["rail"]
+
+def _has_layer(shapefile):
+    # A GeoDataFrame has no truth value, and an empty one is still a layer that was given
+    return isinstance(shapefile, gpd.GeoDataFrame) or bool(shapefile)
+
+# Columns naming the entities in each layer's results; rows for the same feature are merged into one
+ENTITY_COLUMNS = {
+    "cities": ["NAME"],
+    "counties": ["NAME", "STATEFP"],
+    "padus": ["Unit_Nm"],
+    "rail": ["SUBDIV", "STATE", "RROWNER1", "TRKRGHTS1", "FRAARCID"],
+}
+
+# How each measure column is merged across an entity's rows
+MEASURE_AGGREGATIONS = {"LENGTH_MI": "sum", "ENTRY_MP": "min", "EXIT_MP": "max", "MILEPOST": "min"}
+
+def normalize_intersections(intersection, layer):
+    """Return one row per entity of ``layer`` in route order, with a COUNT of the rows merged into it.
+
+    A feature crossed by several route lines, or a rail line crossed several times, is one entity.
+    Entities are the matched features (``index_right``), so two cities that share a name stay two
+    lines; the ENTITY_COLUMNS only label them. COUNT is the number of crossing points for rail measures (one row each), and otherwise the number
+    of route lines meeting the entity. Measures are merged as well: lengths are summed, entry and
+    first milepost take the minimum, exit the maximum. Mileposts run along the whole route, so these
+    span every route line.
+    """
+    names = [col for col in ENTITY_COLUMNS[layer] if col in intersection]
+    # Results without the feature index (e.g. built by hand) can only be told apart by name
+    keys = ["index_right"] if "index_right" in intersection else names
+    aggregations = {col: (col, "first") for col in names if col not in keys}
+    aggregations["COUNT"] = (keys[0], "size")
+    aggregations.update({col: (col, how) for col, how in MEASURE_AGGREGATIONS.items() if col in intersection})
+    summary = intersection.groupby(keys, sort=False, dropna=False, observed=True).agg(**aggregations).reset_index()
+    return summary[names + [col for col in summary if col not in names and col != "index_right"]]
+
+def entity_labels(summary, names):
+    """Append the count and measures of each normalized entity to ``names`` (a Series of display names)."""
+    labels = names.astype(str)
+    if "LENGTH_MI" in summary:
+        labels = labels + " (" + _decimals(summary["LENGTH_MI"]) + " mi, MP " + _decimals(summary["ENTRY_MP"]) + " to " + _decimals(summary["EXIT_MP"]) + ")"
+    if "MILEPOST" in summary:
+        labels = labels + ", MP " + _decimals(summary["MILEPOST"])
+    # Only rail measures have a row per crossing; otherwise the rows are the route lines that met the entity
+    counted = " crossings]" if "MILEPOST" in summary else " route lines]"
+    return labels.where(summary["COUNT"] == 1, labels + " [" + summary["COUNT"].astype(str) + counted)
+
+def _decimals(values):
+    return pd.Series(np.char.mod("%.2f", values.to_numpy(dtype=float)), index=values.index)
+
+def report_lines(intersection, layer):
+    """Return the report's bullet text for each entity in a layer's intersection, or None when the layer was not given."""
+    if intersection is None:
+        return None
+    summary = normalize_intersections(intersection, layer)
+    if layer == "rail":
+        names = (summary["SUBDIV"].astype(str) + ", " + summary["STATE"].astype(str) + ", Owner: " + summary["RROWNER1"].astype(str)
+                 + ", Track Rights: " + summary["TRKRGHTS1"].astype(str) + ", FRA ID: " + summary["FRAARCID"].astype(str))
+    else:
+        names = summary[ENTITY_COLUMNS[layer][0]]
+    return entity_labels(summary, names).tolist()
+
+def llm_payload(intersection, layer, max_tokens=1000):
+    """Serialize a layer's normalized entities as compact pipe-separated rows for a prompt.
+
+    Rows past roughly ``max_tokens`` (at about four characters per token) are left out and counted in
+    a final line, so huge routes cannot overflow the prompt.
+    """
+    summary = normalize_intersections(intersection, layer)
+    measures = [col for col in MEASURE_AGGREGATIONS if col in summary]
+    summary[measures] = summary[measures].round(2)
+    
+    columns = summary.columns.tolist()
+    rows = summary[columns[0]].astype(str)
+    for col in columns[1:]:
+        rows = rows + "|" + summary[col].astype(str)
+    
+    header = "|".join(columns)
+    keep = np.cumsum(rows.str.len().to_numpy() + 1) + len(header) <= max_tokens * 4
+    lines = [header] + rows[keep].tolist()
+    if not keep.all():
+        lines.append(f"... and {int((~keep).sum())} more")
+    return "\n".join(lines)
+
+def write_report(report_content, cities, counties, padus, rail, output_path="permit_report.md", stats=None):
     
     # Check and retrieve intersecting data
     cities = cities.get_intersection() if isinstance(cities, CitiesShapefile) else cities
@@ -41,13 +264,10 @@ def write_report(report_content, cities, counties, padus, rail, output_path="per
     rail = rail.get_intersection() if isinstance(rail, RailShapefile) else rail
     
     # Convert intersecting data to lists for Markdown bullet points
-    cities_list = cities["NAME"].tolist() if cities is not None else None
-    counties_list = counties["NAME"].tolist() if counties is not None else None
-    padus_list = padus["Unit_Nm"].tolist() if padus is not None else None
-    rail_list = [
-        f"{x['SUBDIV']}, {x['STATE']}, Owner: {x['RROWNER1']}, Track Rights: {x['TRKRGHTS1']}, FRA ID: {x['FRAARCID']}"
-        for _, x in rail.iterrows()
-    ] if rail is not None else None
+    cities_list = report_lines(cities, "cities")
+    counties_list = report_lines(counties, "counties")
+    padus_list = report_lines(padus, "padus")
+    rail_list = report_lines(rail, "rail")
     
     # Write to Markdown file
     with open(output_path, "w") as file:
@@ -90,24 +310,33 @@ def write_report(report_content, cities, counties, padus, rail, output_path="per
         
         # AI-generated permitting report
         file.write(report_content)
+        
+        # Optional timings of the run that produced the report
+        if stats is not None:
+            write_performance(file, stats)
     
     print(f"Report saved to {output_path}")
 
+def write_performance(file, stats):
+    file.write("\n\n---\n\n## Performance\n\n")
+    file.write(stats.to_markdown())
+
 
-def ai_summary(api_key, cities, counties, padus, rail, to_md=True):
+def ai_summary(api_key, cities, counties, padus, rail, to_md=True, max_payload_tokens: int=4000):
     # Ensure data compatibility
     cities = cities.get_intersection() if isinstance(cities, CitiesShapefile) else cities
     counties = counties.get_intersection() if isinstance(counties, CountiesShapefile) else counties
     padus = padus.get_intersection() if isinstance(padus, PADUSShapefile) else padus
     rail = rail.get_intersection() if isinstance(rail, RailShapefile) else rail
     
-    # Generate report using OpenAI API
+    # Generate report using OpenAI API; the client is only imported by runs that use it
+    import openai
     try:
         client = openai.OpenAI(api_key=api_key)
     except Exception as e:
         raise ValueError(f"Error initializing OpenAI client: {e}")
 
-    response = client.chat.completions.create(
+    request = dict(
         model="gpt-4o",
         messages=[
             {"role": "system", "content": "You are a permitting specialist for long-haul fiber optic installations, responsible for ensuring only verified and working websites are referenced for permitting and regulatory information."},
@@ -124,15 +353,17 @@ def ai_summary(api_key, cities, counties, padus, rail, to_md=True):
 Make sure each section is separated and clearly labeled. Provide details as bullet points or structured lists for easy reading, and prioritize clarity and accessibility of contact information and URLs. If information is unavailable, indicate 'information not found.' 
 
 **Intersecting Locations**:
-- **Cities**: {cities if cities is not None else "Cities information was not provided."}
-- **Counties**: {counties if counties is not None else "Counties information was not provided."}
-- **PADUS Areas**: {padus if padus is not None else "PADUS information was not provided."}
-- **Rail Intersections**: {rail if rail is not None else "Rail information was not provided."}
+- **Cities**: {llm_payload(cities, "cities", max_payload_tokens // 4) if cities is not None else "Cities information was not provided."}
+- **Counties**: {llm_payload(counties, "counties", max_payload_tokens // 4) if counties is not None else "Counties information was not provided."}
+- **PADUS Areas**: {llm_payload(padus, "padus", max_payload_tokens // 4) if padus is not None else "PADUS information was not provided."}
+- **Rail Intersections**: {llm_payload(rail, "rail", max_payload_tokens // 4) if rail is not None else "Rail information was not provided."}
 
 Additionally, emphasize any considerations for environmental impact, protected species, or cultural sites that may require special permissions along the fiber optic route, especially within sensitive or restricted areas. Be sure to provide working links where you can."""
             }
         ]
     )
+    with stage("llm"):
+        response = client.chat.completions.create(**request)
     
     response_content = response.choices[0].message.content
     if to_md:
@@ -141,15 +372,106 @@ Additionally, emphasize any considerations for environmental impact, protected s
     return response_content
 
 
-def get_permit_summary(line_path, cities_path: str=None, counties_path: str=None, padus_path: str=None, rail_path: str=None, output_path: str=None, use_llm: bool=False, api_key: str=None):
-    cities, counties, padus, rail = identify_permitting_locations(line_path, cities_path, counties_path, padus_path, rail_path)
+def get_permit_summary(line_path, cities_path: str=None, counties_path: str=None, padus_path: str=None, rail_path: str=None, output_path: str=None, use_llm: bool=False, api_key: str=None, bounded_read: bool=True, cache=None, parallel: bool=False, max_workers: int=4, corridor=None, units="ft", measures: bool=False, store=None, stats=None, perf_appendix: bool=False, llm_sections: bool=False, base_url: str=None, max_concurrency: int=4, guidance_cache=None, tiles=None, invalid="repair"):
+    # Stages are only timed when a RunStats is given or the report gets a performance appendix
+    stats = RunStats() if stats is None and perf_appendix else stats
+    with stats.activate() if stats is not None else nullcontext():
+        cities, counties, padus, rail = identify_permitting_locations(line_path, cities_path, counties_path, padus_path, rail_path, bounded_read, cache, parallel, max_workers, corridor, units, measures, store, tiles, invalid)
+        
+        # With llm_sections, each section is a separate concurrent request streamed into the report
+        if use_llm and api_key is not None and llm_sections:
+            return stream_permit_summary(api_key, cities, counties, padus, rail, output_path, stats if perf_appendix else None,
+                                         base_url=base_url, max_concurrency=max_concurrency, guidance_cache=guidance_cache)
+        
+        if use_llm and api_key is not None:
+            report_content = ai_summary(api_key, cities, counties, padus, rail, to_md=False)
+        else:
+            report_content = ""
+        
+        if output_path:
+            with stage("report"):
+                write_report(report_content, cities, counties, padus, rail, output_path, stats if perf_appendix else None)
+        
+    return report_content
+
+def stream_permit_summary(api_key, cities, counties, padus, rail, output_path=None, stats=None, **options):
+    """Write the report with the LLM sections streamed in as they arrive; ``options`` go to ai_section_summary."""
+    from .llm import ai_section_summary
     
-    if use_llm and api_key is not None:
-        report_content = ai_summary(api_key, cities, counties, padus, rail, to_md=False)
-    else:
-        report_content = ""
+    if not output_path:
+        return ai_section_summary(api_key, cities, counties, padus, rail, **options)
     
-    if output_path:
-        write_report(report_content, cities, counties, padus, rail, output_path)
-        
+    # The intersecting locations are written first, so the file is useful while the sections stream in
+    write_report("", cities, counties, padus, rail, output_path)
+    with open(output_path, "a") as file:
+        report_content = ai_section_summary(api_key, cities, counties, padus, rail, file, **options)
+        if stats is not None:
+            write_performance(file, stats)
     return report_content
+
+
+def get_batch_permit_summary(routes, cities_path: str=None, counties_path: str=None, padus_path: str=None, rail_path: str=None, output_dir: str=".", route_id_col: str=None, use_llm: bool=False, api_key: str=None, bounded_read: bool=True, cache=None, parallel: bool=False, max_workers: int=4, corridor=None, units="ft", measures: bool=False, stats=None, tiles=None, invalid="repair"):
+    """Write a report for every route in ``routes`` and a comparison summary across them.
+
+    ``routes`` is a directory of route files, a list of route files, a multi-route file (see
+    ``RouteSet.from_source``) or a RouteSet. Each reference layer is loaded once and joined against
+    all routes in a single sjoin. Returns the comparison summary as a DataFrame. Pass a RunStats as
+    ``stats`` to record the time spent in each stage, and a TileStore as ``tiles`` to read partitioned
+    layers from the tiles near the routes. ``invalid`` is how invalid geometries are handled: "repair",
+    "drop" or "fail".
+    """
+    with stats.activate() if stats is not None else nullcontext():
+        return _batch_permit_summary(routes, cities_path, counties_path, padus_path, rail_path, output_dir, route_id_col, use_llm, api_key,
+                                     bounded_read, cache, parallel, max_workers, corridor, units, measures, tiles, invalid)
+
+def _batch_permit_summary(routes, cities_path, counties_path, padus_path, rail_path, output_dir, route_id_col, use_llm, api_key, bounded_read, cache, parallel, max_workers, corridor, units, measures, tiles, invalid):
+    route_set = routes if isinstance(routes, RouteSet) else RouteSet.from_source(routes, route_id_col)
+    results = intersect_layers(route_set, cities_path, counties_path, padus_path, rail_path, parallel, max_workers,
+                               bounded_read=bounded_read, cache=cache, corridor=corridor, units=units, measures=measures, tiles=tiles, invalid=invalid)
+    
+    # Split every layer's result by route once, instead of filtering it for each route
+    route_ids = route_set.gdf["route_id"]
+    by_route = [dict(tuple(result.groupby(route_ids.loc[result.index].to_numpy(), sort=False))) if result is not None else None for result in results]
+    lengths = route_set.lengths()
+    
+    os.makedirs(output_dir, exist_ok=True)
+    summary = []
+    for route_id in route_set.route_ids:
+        cities, counties, padus, rail = [
+            groups.get(route_id, result.iloc[:0]) if result is not None else None
+            for groups, result in zip(by_route, results)
+        ]
+        report_content = ai_summary(api_key, cities, counties, padus, rail, to_md=False) if use_llm and api_key is not None else ""
+        with stage("report", route_id):
+            write_report(report_content, cities, counties, padus, rail, os.path.join(output_dir, f"{_file_name(route_id)}_permit_report.md"))
+        row = {
+            "Route": route_id,
+            "Length (mi)": round(lengths[route_id], 2),
+            # Counted by matched feature, since different cities, counties or areas can share a name
+            "Cities": cities["index_right"].nunique() if cities is not None else None,
+            "Counties": counties["index_right"].nunique() if counties is not None else None,
+            "Protected Areas": padus["index_right"].nunique() if padus is not None else None,
+            "Rail Segments": rail["FRAARCID"].nunique() if rail is not None else None,
+        }
+        if measures:
+            # With measures the rail result has one row per crossing point
+            row["Rail Crossings"] = len(rail) if rail is not None else None
+        summary.append(row)
+    
+    summary = pd.DataFrame(summary)
+    write_comparison_summary(summary, os.path.join(output_dir, "route_comparison.md"))
+    return summary
+
+def write_comparison_summary(summary, output_path="route_comparison.md"):
+    columns = summary.columns.tolist()
+    with open(output_path, "w") as file:
+        file.write("# Route Comparison:\n\n")
+        file.write("| " + " | ".join(columns) + " |\n")
+        file.write("|" + "---|" * len(columns) + "\n")
+        for row in summary.itertuples(index=False):
+            file.write("| " + " | ".join("n/a" if pd.isna(value) else str(value) for value in row) + " |\n")
+    
+    print(f"Comparison saved to {output_path}")
+
+def _file_name(route_id):
+    return re.sub(r"[^\w.-]+", "_", str(route_id)).strip("_") or "route"
@@ -0,0 +1,81 @@
+from qgis.core import QgsFeatureRequest, QgsRectangle, QgsVectorLayerFeatureSource
+from qgis.PyQt.QtCore import QVariant
+
+from .instrumentation import stage
+
+
+# Attributes each reference layer needs for the joins and the report; nothing else is fetched
+LAYER_COLUMNS = {
+    "line": [],
+    "cities": ["NAME", "layer"],
+    "counties": ["NAME", "STATEFP"],
+    "padus": ["Unit_Nm"],
+    "rail": ["SUBDIV", "STATE", "RROWNER1", "TRKRGHTS1", "FRAARCID"],
+}
+
+
+class LayerSnapshot:
+    """The features of a loaded QGIS vector layer, exported to a GeoDataFrame off the main thread.
+
+    Create the snapshot on the main thread: it captures a feature source (which honours the layer's
+    subset string), the current selection and the CRS. ``to_gdf`` can then run in a QgsTask. Only the
+    selected features are exported when anything is selected, and only ``columns`` are fetched.
+    ``path`` is the layer's shapefile when reading it gives the same features, so the report can read
+    it through the layer cache instead of exporting it.
+    """
+    def __init__(self, layer, columns=None):
+        self.name = layer.name()
+        self.source = QgsVectorLayerFeatureSource(layer)
+        self.fields = layer.fields()
+        self.columns = [name for name in (columns or []) if self.fields.indexOf(name) >= 0]
+        self.selected_ids = list(layer.selectedFeatureIds())
+        self.crs = layer.crs().authid() or layer.crs().toWkt()
+        
+        # The shapefile behind the layer, when reading the file gives exactly the same features
+        source = layer.source().split("|")[0]
+        plain_file = layer.providerType() == "ogr" and not layer.subsetString() and not self.selected_ids
+        self.path = source if plain_file and source.lower().endswith(".shp") else None
+
+    def to_gdf(self, route=None, distance=0):
+        """Return the features as a GeoDataFrame indexed by feature id.
+
+        With a ``route`` GeoDataFrame, only features whose bounding box meets the envelope of one of its
+        lines, widened by ``distance`` meters, are exported, using the provider's spatial index.
+        """
+        import geopandas as gpd
+        import shapely
+        from .classes import route_mask
+
+        request = QgsFeatureRequest().setSubsetOfAttributes(self.columns, self.fields)
+        if self.selected_ids:
+            request.setFilterFids(self.selected_ids)
+        if route is None:
+            extents = [None]
+        else:
+            extents = [QgsRectangle(*part.bounds) for part in shapely.get_parts(route_mask(route, self.crs, distance))]
+
+        ids, wkbs = [], []
+        values = {name: [] for name in self.columns}
+        seen = set()  # A feature near several route lines is fetched once for each of them
+        with stage("export", self.name) as record:
+            for extent in extents:
+                if extent is not None:
+                    request.setFilterRect(extent)
+                for feature in self.source.getFeatures(request):
+                    geometry = feature.geometry()
+                    if geometry.isNull() or feature.id() in seen:
+                        continue
+                    seen.add(feature.id())
+                    ids.append(feature.id())
+                    wkbs.append(bytes(geometry.asWkb()))
+                    for name in self.columns:
+                        values[name].append(_python_value(feature[name]))
+            record.rows = len(ids)
+
+        # In feature id order, as from a full export, however the extents were visited
+        return gpd.GeoDataFrame(values, geometry=shapely.from_wkb(wkbs), index=ids, crs=self.crs).sort_index()
+
+
+def _python_value(value):
+    # Depending on the QGIS version, NULL attributes come back as a null QVariant rather than None
+    return None if isinstance(value, QVariant) and value.isNull() else value
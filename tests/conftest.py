@@ -0,0 +1,10 @@
+import importlib.util
+import os
+import sys
+
+# The plugin directory is the package itself; import it as ``uterra`` whatever the checkout is called
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if "uterra" not in sys.modules:
+    spec = importlib.util.spec_from_file_location("uterra", os.path.join(ROOT, "__init__.py"), submodule_search_locations=[ROOT])
+    sys.modules["uterra"] = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(sys.modules["uterra"])
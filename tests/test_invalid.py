@@ -0,0 +1,34 @@
+import geopandas as gpd
+import pytest
+import shapely
+
+from uterra.cache import ResultStore
+from uterra.permits import identify_permitting_locations
+
+
+def write_layers(tmp_path):
+    """A route crossing a valid protected area and a bowtie (self-intersecting) one."""
+    route = gpd.GeoDataFrame(geometry=[shapely.LineString([(0, 0), (3, 0)])], crs="EPSG:4326")
+    bowtie = shapely.Polygon([(1.5, -1), (2.5, 1), (2.5, -1), (1.5, 1), (1.5, -1)])
+    padus = gpd.GeoDataFrame({"Unit_Nm": ["Valid", "Bowtie"]}, geometry=[shapely.box(0.5, -1, 1, 1), bowtie], crs="EPSG:4326")
+    route.to_file(tmp_path / "route.shp")
+    padus.to_crs("EPSG:3857").to_file(tmp_path / "padus.shp")  # PADUS is distributed in Web Mercator
+    return str(tmp_path / "route.shp"), str(tmp_path / "padus.shp")
+
+
+@pytest.mark.parametrize("use_store", [False, True])
+@pytest.mark.parametrize("invalid, names", [("repair", ["Valid", "Bowtie"]), ("drop", ["Valid"])])
+def test_invalid_mode_reaches_the_layers(tmp_path, invalid, names, use_store):
+    route, padus_path = write_layers(tmp_path)
+    store = ResultStore(tmp_path / "store") if use_store else None
+
+    padus = identify_permitting_locations(route, None, None, padus_path, invalid=invalid, store=store)[2]
+
+    assert padus["Unit_Nm"].tolist() == names
+
+
+def test_invalid_fail_stops_the_run(tmp_path):
+    route, padus_path = write_layers(tmp_path)
+
+    with pytest.raises(ValueError, match="1 invalid geometries"):
+        identify_permitting_locations(route, None, None, padus_path, invalid="fail")
@@ -0,0 +1,150 @@
+import io
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pandas as pd
+import pytest
+
+from uterra.llm import SectionWriter, ai_section_summary
+
+
+class StandIn:
+    """A local OpenAI-compatible chat completions server that streams ``- Guidance for <heading> (try N)`` per heading.
+
+    ``plans`` maps a section title to what each attempt does: "ok", "cut" (the stream stops before a
+    finish reason), or an HTTP status to fail with. ``delays`` slows a section's chunks, in seconds.
+    """
+    def __init__(self, plans=None, delays=None):
+        self.plans = plans or {}
+        self.delays = delays or {}
+        self.calls = {}
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.url = f"http://127.0.0.1:{self.server.server_port}/v1"
+
+    def _handler(stand_in):
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                prompt = json.loads(self.rfile.read(int(self.headers["Content-Length"])))["messages"][-1]["content"]
+                section = prompt.split("**")[1]
+                with stand_in._lock:
+                    attempt = stand_in.calls[section] = stand_in.calls.get(section, 0) + 1
+                plan = stand_in.plans.get(section, [])
+                action = plan[attempt - 1] if attempt <= len(plan) else "ok"
+                if isinstance(action, int):
+                    body = json.dumps({"error": {"message": f"status {action}"}}).encode()
+                    self.send_response(action)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+
+                self.send_response(200)
+                self.send_header("Content-Type", "text/event-stream")
+                self.send_header("Connection", "close")
+                self.end_headers()
+                headings = re.findall(r"^### (.+)$", prompt, flags=re.MULTILINE)
+                pieces = [text for heading in headings for text in (f"### {heading}\n", f"- Guidance for {heading} (try {attempt})\n")]
+                for i, text in enumerate(pieces):
+                    if action == "cut" and i == 2:
+                        self.close_connection = True
+                        return
+                    self._event({"delta": {"content": text}, "finish_reason": None})
+                    time.sleep(stand_in.delays.get(section, 0))
+                self._event({"delta": {}, "finish_reason": "stop"})
+                self.wfile.write(b"data: [DONE]\n\n")
+                self.wfile.flush()
+
+            def _event(self, choice):
+                chunk = {"id": "stand-in", "object": "chat.completion.chunk", "created": 0, "model": "stand-in", "choices": [{"index": 0, **choice}]}
+                self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+                self.wfile.flush()
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+CITIES = pd.DataFrame({"NAME": ["Provo", "Orem"]})
+COUNTIES = pd.DataFrame({"NAME": ["Utah"], "STATEFP": ["Utah"]})
+RAIL = pd.DataFrame({"RROWNER1": ["UP", "BNSF"]})
+
+
+def summarize(stand_in, path, **options):
+    with open(path, "w+") as file:
+        text = ai_section_summary("test-key", CITIES, COUNTIES, None, RAIL, file=file, base_url=stand_in.url, backoff=0, **options)
+    with open(path) as file:
+        return text, file.read()
+
+
+def test_cut_off_stream_is_retried_and_rewound(tmp_path):
+    # Cities is the first section, so its partial response has already been written to the file
+    with StandIn(plans={"Cities": ["cut"]}) as stand_in:
+        text, written = summarize(stand_in, tmp_path / "report.md")
+
+    assert stand_in.calls["Cities"] == 2
+    assert "Provo (try 1)" not in written
+    assert "### Provo\n- Guidance for Provo (try 2)\n### Orem\n- Guidance for Orem (try 2)\n" in written
+    assert written.strip() == text.strip()
+
+
+def test_server_error_then_success(tmp_path):
+    with StandIn(plans={"Counties": [500]}) as stand_in:
+        text, written = summarize(stand_in, tmp_path / "report.md")
+
+    assert stand_in.calls["Counties"] == 2
+    assert "- Guidance for Utah, Utah (try 2)" in written
+    assert "could not be generated" not in written
+
+
+def test_sections_finishing_out_of_order_are_written_in_report_order(tmp_path):
+    # Cities streams slowly, so Counties and Railway Crossings finish first and wait in the buffer
+    with StandIn(delays={"Cities": 0.05}) as stand_in:
+        text, written = summarize(stand_in, tmp_path / "report.md")
+
+    headings = re.findall(r"^## (.+)$", written, flags=re.MULTILINE)
+    assert headings == ["Cities", "Counties", "Protected Areas (PADUS)", "Railway Crossings"]
+    assert written.index("Guidance for Orem") < written.index("## Counties") < written.index("Guidance for Utah, Utah") < written.index("Guidance for BNSF")
+    assert "Protected Areas (PADUS) information was not provided." in written
+    assert written.strip() == text.strip()
+
+
+def test_failed_section_gets_a_note_and_the_rest_of_the_report_is_written(tmp_path):
+    with StandIn(plans={"Railway Crossings": [500, 500], "Counties": [400]}) as stand_in:
+        text, written = summarize(stand_in, tmp_path / "report.md", retries=1)
+
+    assert stand_in.calls["Railway Crossings"] == 2
+    assert stand_in.calls["Counties"] == 1  # A bad request is not retried
+    assert "_Guidance for the remaining railway crossings could not be generated:" in written
+    assert "_Guidance for the remaining counties could not be generated:" in written
+    assert "- Guidance for Orem (try 1)" in written
+
+
+@pytest.mark.parametrize("finish_order", [[0, 1, 2], [2, 1, 0], [1, 2, 0]])
+def test_section_writer_buffers_until_earlier_sections_finish(finish_order):
+    file = io.StringIO()
+    writer = SectionWriter(file, ["A", "B", "C"])
+    for position in (2, 1, 0):
+        writer.write(position, f"text {position}\n")
+    writer.restart(0)
+    writer.write(0, "text 0 again\n")
+    for position in finish_order:
+        writer.finish(position)
+
+    assert file.getvalue() == "## A\n\ntext 0 again\n\n\n## B\n\ntext 1\n\n\n## C\n\ntext 2\n\n\n"
+    assert file.getvalue() == writer.text()
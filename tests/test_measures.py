@@ -0,0 +1,36 @@
+import geopandas as gpd
+import numpy as np
+import pytest
+import shapely
+
+from uterra.classes import METERS_PER_MILE, CountiesShapefile, RailShapefile
+
+
+def two_placemark_route():
+    """A route along the equator in two features, 0 to 1 and 1 to 2 degrees east."""
+    return gpd.GeoDataFrame({"name": ["Segment 1", "Segment 2"]}, geometry=[shapely.LineString([(0, 0), (1, 0)]), shapely.LineString([(1, 0), (2, 0)])], crs="EPSG:4326")
+
+
+def test_mileposts_continue_across_route_features():
+    route = two_placemark_route()
+    counties = CountiesShapefile(gpd.GeoDataFrame({"NAME": ["West", "East"], "STATEFP": ["49", "49"]}, geometry=[shapely.box(0.2, -1, 0.8, 1), shapely.box(1.2, -1, 1.8, 1)], crs="EPSG:4326"))
+
+    result = counties.get_intersection(route, measures=True)
+    first_length = shapely.length(route.to_crs(epsg=32631).geometry[0]) / METERS_PER_MILE
+
+    east = result[result["NAME"] == "East"].iloc[0]
+    assert east["ENTRY_MP"] > first_length
+    assert east["EXIT_MP"] - east["ENTRY_MP"] == pytest.approx(east["LENGTH_MI"])
+
+
+def test_crossing_mileposts_are_route_global():
+    route = two_placemark_route()
+    rail = RailShapefile(gpd.GeoDataFrame({"SUBDIV": ["A", "B"], "STATE": ["UT", "UT"], "RROWNER1": ["UP", "UP"], "TRKRGHTS1": ["UP", "UP"], "FRAARCID": [1, 2]},
+                                          geometry=[shapely.LineString([(0.5, -1), (0.5, 1)]), shapely.LineString([(1.5, -1), (1.5, 1)])], crs="EPSG:4326"))
+
+    crossings = rail.get_crossings(route)
+
+    assert list(crossings["name"]) == ["Segment 1", "Segment 2"]
+    assert list(crossings["SUBDIV"]) == ["A", "B"]
+    assert np.all(np.diff(crossings["MILEPOST"]) > 0)
+    assert crossings["MILEPOST"].iloc[1] == pytest.approx(3 * crossings["MILEPOST"].iloc[0], rel=0.01)
@@ -0,0 +1,45 @@
+import geopandas as gpd
+import pandas as pd
+import shapely
+
+from uterra.classes import CitiesShapefile
+from uterra.permits import normalize_intersections, report_lines
+
+
+def test_counties_count_route_lines_and_span_the_whole_route():
+    # One county met by placemarks 0 and 1, with mileposts measured along the whole route
+    intersection = pd.DataFrame({"NAME": ["Salt Lake", "Salt Lake", "Tooele"], "STATEFP": ["Utah", "Utah", "Utah"],
+                                 "LENGTH_MI": [4.0, 6.0, 2.0], "ENTRY_MP": [76.0, 80.0, 86.0], "EXIT_MP": [80.0, 86.0, 88.0]}, index=[0, 1, 1])
+
+    summary = normalize_intersections(intersection, "counties")
+
+    assert summary[["NAME", "COUNT", "LENGTH_MI", "ENTRY_MP", "EXIT_MP"]].values.tolist() == [["Salt Lake", 2, 10.0, 76.0, 86.0], ["Tooele", 1, 2.0, 86.0, 88.0]]
+    assert report_lines(intersection, "counties") == ["Salt Lake (10.00 mi, MP 76.00 to 86.00) [2 route lines]", "Tooele (2.00 mi, MP 86.00 to 88.00)"]
+
+
+def test_rail_measures_count_crossings():
+    intersection = pd.DataFrame({"SUBDIV": ["Sub 1"] * 2, "STATE": ["Utah"] * 2, "RROWNER1": ["UP"] * 2, "TRKRGHTS1": ["UP"] * 2, "FRAARCID": [7, 7],
+                                 "MILEPOST": [12.5, 14.0]}, index=[0, 1])
+
+    assert report_lines(intersection, "rail") == ["Sub 1, Utah, Owner: UP, Track Rights: UP, FRA ID: 7, MP 12.50 [2 crossings]"]
+
+
+def test_features_sharing_a_name_stay_separate():
+    # Two cities called Springfield, far apart on one route line
+    route = gpd.GeoDataFrame(geometry=[shapely.LineString([(0, 0), (6, 0)])], crs="EPSG:4326")
+    cities = CitiesShapefile(gpd.GeoDataFrame({"NAME": ["Springfield", "Springfield"], "layer": ["city", "city"]},
+                                              geometry=[shapely.box(0.5, -1, 0.6, 1), shapely.box(5.5, -1, 5.6, 1)], crs="EPSG:4326"))
+
+    lines = report_lines(cities.get_intersection(route, measures=True), "cities")
+
+    assert len(lines) == 2
+    assert all(line.startswith("Springfield (6.9") and "route lines" not in line for line in lines)
+
+
+def test_rows_are_merged_by_feature():
+    intersection = pd.DataFrame({"NAME": ["Springfield", "Springfield", "Springfield"], "index_right": [3, 8, 3]}, index=[0, 0, 1])
+
+    summary = normalize_intersections(intersection, "cities")
+
+    assert summary.columns.tolist() == ["NAME", "COUNT"]
+    assert summary["COUNT"].tolist() == [2, 1]
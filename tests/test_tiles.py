@@ -0,0 +1,37 @@
+import geopandas as gpd
+import numpy as np
+import shapely
+
+from uterra.classes import PADUSShapefile
+from uterra.tiles import TileStore
+
+
+def write_parks(path, count=2000):
+    """Write ``count`` small square parks spread over 4 x 4 degrees, in web mercator like the PADUS source."""
+    rng = np.random.default_rng(0)
+    lon, lat = rng.uniform(-112, -108, count), rng.uniform(38, 42, count)
+    parks = gpd.GeoDataFrame({"Unit_Nm": [f"Park {i}" for i in range(count)]}, geometry=shapely.buffer(shapely.points(lon, lat), 0.01, cap_style="square"), crs="EPSG:4326")
+    parks.to_crs("EPSG:3857").to_file(path)
+
+
+def test_tiles_are_sized_in_degrees_for_projected_layers(tmp_path):
+    write_parks(tmp_path / "padus.shp")
+    index = TileStore(tmp_path / "tiles", tile_size=1.0).build(PADUSShapefile, str(tmp_path / "padus.shp"))
+
+    # 4 x 4 one-degree tiles (plus a few along the edges), not one tile per feature
+    assert len(index) <= 25
+    assert index["rows"].sum() == 2000
+
+
+def test_load_reads_the_features_near_the_route(tmp_path):
+    write_parks(tmp_path / "padus.shp")
+    tiles = TileStore(tmp_path / "tiles", tile_size=1.0)
+    tiles.build(PADUSShapefile, str(tmp_path / "padus.shp"))
+    route = gpd.GeoDataFrame(geometry=[shapely.LineString([(-111.5, 38.5), (-111.5, 39.5)])], crs="EPSG:4326")
+
+    gdf = tiles.load(PADUSShapefile, str(tmp_path / "padus.shp"), route)
+    expected = PADUSShapefile(str(tmp_path / "padus.shp")).gdf
+    expected = expected[expected.intersects(route.to_crs(expected.crs).geometry[0])]
+
+    assert len(gdf) < 2000
+    assert set(expected.index) <= set(gdf.index)
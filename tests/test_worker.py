@@ -0,0 +1,43 @@
+import json
+import threading
+import urllib.error
+import urllib.request
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from uterra.worker import Worker, _handler
+
+
+def run_failing_job(worker):
+    # An unsupported route file fails at once, which is enough to finish a job
+    job = worker.submit("route.txt")
+    job.future.result()
+    assert job.state == "failed"
+    return job
+
+
+def test_oldest_finished_jobs_are_forgotten_beyond_the_limit():
+    worker = Worker(max_finished_jobs=2)
+    jobs = [run_failing_job(worker) for _ in range(4)]
+
+    assert worker.job(jobs[0].id) is None
+    assert worker.job(jobs[1].id) is None
+    assert [worker.job(job.id) for job in jobs[2:]] == jobs[2:]
+    assert worker.job_states()["failed"] == 2
+
+
+def test_expired_jobs_are_not_found():
+    worker = Worker(job_ttl=0)
+    job = run_failing_job(worker)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _handler(worker))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(f"http://127.0.0.1:{server.server_port}/jobs/{job.id}", timeout=10)
+        assert error.value.code == 404
+        assert json.loads(error.value.read()) == {"error": "no such job"}
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert worker.jobs == {}
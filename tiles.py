@@ -0,0 +1,112 @@
+import os
+import shutil
+import threading
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+import shapely
+
+from .cache import source_key
+from .classes import route_mask
+from .instrumentation import stage
+
+
+DEFAULT_TILE_DIR = os.environ.get("UTERRA_TILE_DIR", os.path.join(os.path.expanduser("~"), ".uterra", "tiles"))
+
+
+class TileStore:
+    """Preprocessed reference layers partitioned into square grid tiles on disk, so a route only reads the tiles it touches.
+
+    ``build`` reads a layer once, preprocesses it like a normal read and writes it to GeoParquet with
+    one row group per ``tile_size`` degree tile, next to an index of the tiles' extents. Each feature
+    goes to the tile holding the lower-left corner of its bounding box, and a tile's extent covers all
+    of its features, so features spanning tiles are stored once and still found. ``load`` reads only
+    the row groups of the tiles whose extent meets the route, so memory and I/O follow the route's
+    footprint rather than the layer's size.
+    """
+    def __init__(self, tile_dir=DEFAULT_TILE_DIR, tile_size=1.0):
+        self.tile_dir = tile_dir
+        self.tile_size = tile_size
+
+    def version(self, layer_class, shapefile_path, columns=None, invalid="repair"):
+        """Return the key a layer's tiles are stored under; it changes whenever the source file does."""
+        return source_key(shapefile_path, layer_class.__name__, self.tile_size, "EPSG:4326", columns or layer_class.columns, invalid)
+
+    def build(self, layer_class, shapefile_path, columns=None, invalid="repair"):
+        """Partition a reference layer into tiles, replacing any tiles of an older version of it. Returns the tile index.
+
+        Only ``columns`` (by default the layer's own ``columns``) are stored besides the geometry, and
+        invalid geometries are handled as ``invalid``; loads with another mode do not use these tiles.
+        """
+        gdf = layer_class(shapefile_path, invalid=invalid, columns=columns).gdf
+        bounds = gdf.bounds.to_numpy()
+        # Layers stay in their own CRS, so the corners are taken to degrees to pick the tiles;
+        # the tile extents below stay in the layer's CRS, which is what routes are masked in
+        corners = gpd.GeoSeries(shapely.points(bounds[:, :2]), crs=gdf.crs).to_crs("EPSG:4326")
+        tiles = np.char.add(np.char.add(
+            np.floor(corners.x.to_numpy() / self.tile_size).astype(int).astype(str), "_"),
+            np.floor(corners.y.to_numpy() / self.tile_size).astype(int).astype(str))
+        order = np.argsort(tiles, kind="stable")
+        gdf, tiles, bounds = gdf.iloc[order].assign(tile=tiles[order]), tiles[order], bounds[order]
+
+        index = pd.DataFrame({"tile": tiles, "xmin": bounds[:, 0], "ymin": bounds[:, 1], "xmax": bounds[:, 2], "ymax": bounds[:, 3]})
+        index = index.groupby("tile").agg(xmin=("xmin", "min"), ymin=("ymin", "min"), xmax=("xmax", "max"), ymax=("ymax", "max"), rows=("tile", "size")).reset_index()
+        index["crs"] = gdf.crs.to_string()
+
+        # Written to a temporary directory first, so readers never see a half-built layer
+        path = os.path.join(self.tile_dir, self.version(layer_class, shapefile_path, columns, invalid))
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        os.makedirs(tmp_path)
+        gdf.to_parquet(os.path.join(tmp_path, "features.parquet"))
+        
+        # Rewritten with one row group per tile, whose statistics let filtered reads skip the other tiles
+        table = pq.read_table(os.path.join(tmp_path, "features.parquet"))
+        with pq.ParquetWriter(os.path.join(tmp_path, "layer.parquet"), table.schema) as writer:
+            for start, rows in zip(np.cumsum(index["rows"]) - index["rows"], index["rows"]):
+                writer.write_table(table.slice(start, rows))
+        os.remove(os.path.join(tmp_path, "features.parquet"))
+        index.to_parquet(os.path.join(tmp_path, "index.parquet"))
+        
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+        print(f"{shapefile_path}: {len(gdf)} features written to {len(index)} tiles in {path}")
+        return index
+
+    def load(self, layer_class, shapefile_path, mask=None, distance=0, columns=None, invalid="repair"):
+        """Return the features in the tiles that can meet ``mask`` (within ``distance`` meters), or None if the layer has no tiles.
+
+        With no mask, every tile is read. Features come back in FID order, as from a normal read.
+        """
+        path = os.path.join(self.tile_dir, self.version(layer_class, shapefile_path, columns, invalid))
+        try:
+            index = pd.read_parquet(os.path.join(path, "index.parquet"))
+        except (OSError, ValueError):
+            return None
+
+        with stage("tiles", layer_class.layer_name) as record:
+            if mask is not None:
+                extents = shapely.box(index["xmin"], index["ymin"], index["xmax"], index["ymax"])
+                index = index[shapely.intersects(extents, route_mask(mask, index["crs"].iloc[0], distance))]
+            tiles = pc.field("tile").isin(pa.array(index["tile"], pa.string()))
+            gdf = gpd.read_parquet(os.path.join(path, "layer.parquet"), filters=tiles).drop(columns="tile").sort_index()
+            record.rows = len(gdf)
+        return gdf
+
+    def clear(self):
+        shutil.rmtree(self.tile_dir, ignore_errors=True)
+
+
+_default_tiles = None
+_default_tiles_lock = threading.Lock()
+
+def default_tiles():
+    """Return the process-wide TileStore, creating it on first use."""
+    global _default_tiles
+    with _default_tiles_lock:
+        if _default_tiles is None:
+            _default_tiles = TileStore()
+        return _default_tiles
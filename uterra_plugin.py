@@ -1,56 +1,144 @@
-import time
+import threading
 from qgis.PyQt import uic
 from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction, QFileDialog, QDialog, QMessageBox
-from qgis.core import QgsProject, QgsMapLayer, QgsMapLayerProxyModel, QgsWkbTypes
+from qgis.core import QgsProject, QgsMapLayer, QgsMapLayerProxyModel, QgsVectorLayer, QgsWkbTypes
 from qgis.PyQt.QtWidgets import QProgressDialog
-from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtCore import Qt, QSettings, QTimer
 import os
-from .permits import get_permit_summary
+# Only QGIS and the standard library are imported when QGIS starts; the analysis stack (geopandas,
+# shapely, openai) is imported by the report task, or earlier by prewarm_imports
+from .qgis_layers import LAYER_COLUMNS, LayerSnapshot
 
 from qgis.core import QgsTask, QgsMessageLog, Qgis, QgsApplication
 
-import os
+
+def prewarm_imports():
+    """Import the analysis modules in a background thread, so the first report does not wait for them.
+
+    Turned off with the QSettings key ``uterra/prewarm`` set to false.
+    """
+    def load():
+        from . import permits, cache  # noqa: F401
+        QgsMessageLog.logMessage("Analysis modules loaded", "UTerra", Qgis.Info)
+
+    if QSettings().value("uterra/prewarm", True, type=bool):
+        threading.Thread(target=load, name="uterra-prewarm", daemon=True).start()
+
+
+# Distance in feet within which the route counts as running alongside a rail line (see get_rail_crossings)
+PARALLEL_DISTANCE_FT = 50
+
 
 class GenerateReportTask(QgsTask):
-    def __init__(self, description, line_path, cities_path, counties_path, padus_path, rail_path, output_path, api_key, use_llm):
+    def __init__(self, description, layers, output_path, api_key, use_llm, worker_url=None, trace_memory=False, invalid="repair"):
         super().__init__(description)
-        self.line_path = line_path
-        self.cities_path = cities_path
-        self.counties_path = counties_path
-        self.padus_path = padus_path
-        self.rail_path = rail_path
+        self.layers = layers  # LayerSnapshot per layer name ("line", "cities", ...), or None when not selected
         self.output_path = output_path
         self.api_key = api_key
         self.use_llm = use_llm
+        self.worker_url = worker_url  # A resident worker (see worker.py) to run the report on, if any
+        self.trace_memory = trace_memory  # Log each stage's peak memory too, at the cost of a much slower run
+        self.invalid = invalid  # Invalid geometries in the reference layers: "repair", "drop" or "fail"
+        self.crossings_path = None  # GeoPackage of rail crossings, written when a rail layer is selected
         self.error_message = None
 
     def run(self):
         """Runs the main task logic in a background thread."""
-        time.sleep(1)
-        from .permits import get_permit_summary  # Import here to avoid GUI blocking
+        # The worker reads reference layers from their files, so only plain shapefile layers can go to it
+        references = [snapshot for name, snapshot in self.layers.items() if name != "line" and snapshot]
+        if self.worker_url and all(snapshot.path for snapshot in references):
+            return self.run_on_worker()
+        
+        from .permits import get_permit_summary, get_rail_crossings, load_route, write_crossings  # Import here to avoid GUI blocking
+        from .cache import default_cache, default_guidance_cache, default_store
+        from .classes import to_meters
+        from .instrumentation import RunStats
+        from .tiles import default_tiles
+        
+        # Log every stage as it finishes, so slow runs show where the time goes
+        stats = RunStats(memory=self.trace_memory, on_stage=lambda record: QgsMessageLog.logMessage(str(record), "UTerra", Qgis.Info))
         try:
+            # Plain shapefile layers are read by path, through the layer cache, result store and tiles; other
+            # layers are exported from QGIS, only near the route (and wide enough for rail parallel runs)
+            with stats.activate():
+                route = self.layers["line"].to_gdf()
+                inputs = {name: (snapshot.path or snapshot.to_gdf(route, to_meters(PARALLEL_DISTANCE_FT))) if snapshot else None
+                          for name, snapshot in self.layers.items() if name != "line"}
+            
             # Generate the permit summary report
             get_permit_summary(
-                line_path=self.line_path,
-                cities_path=self.cities_path,
-                counties_path=self.counties_path,
-                padus_path=self.padus_path,
-                rail_path=self.rail_path,
+                line_path=route,
+                cities_path=inputs["cities"],
+                counties_path=inputs["counties"],
+                padus_path=inputs["padus"],
+                rail_path=inputs["rail"],
                 output_path=self.output_path,
                 api_key=self.api_key,
-                use_llm=self.use_llm
+                use_llm=self.use_llm,
+                cache=default_cache(),
+                # Overlapping stages would share one memory peak, so traced runs load the layers one at a time
+                parallel=not self.trace_memory,
+                store=default_store(),
+                tiles=default_tiles(),
+                invalid=self.invalid,
+                stats=stats,
+                llm_sections=True,
+                guidance_cache=default_guidance_cache()
             )
+            
+            # Rail crossings and parallel runs go to a GeoPackage next to the report, loaded when the task finishes
+            if inputs["rail"] is not None:
+                with stats.activate():
+                    crossings = get_rail_crossings(inputs["rail"], load_route(route), cache=default_cache(),
+                                                   parallel_distance=PARALLEL_DISTANCE_FT, tiles=default_tiles(), invalid=self.invalid)
+                self.crossings_path = os.path.join(os.path.dirname(self.output_path), "rail_crossings.gpkg")
+                write_crossings(crossings, self.crossings_path)
+            QgsMessageLog.logMessage(f"Report generated in {stats.total_seconds:.1f} s", "UTerra", Qgis.Info)
             return True  # Indicate success
         except Exception as e:
             self.error_message = str(e)
             QgsMessageLog.logMessage(f"Error generating report: {e}", "UTerra", Qgis.Critical)
             return False  # Indicate failure
 
+    def run_on_worker(self):
+        """Send the report to the resident worker, relaying its progress and any cancellation."""
+        import json
+        from .worker import FINAL_STATES, WorkerClient
+        
+        client = WorkerClient(self.worker_url)
+        try:
+            route = self.layers["line"].to_gdf().to_crs("EPSG:4326")
+            paths = {f"{name}_path": snapshot.path for name, snapshot in self.layers.items() if name != "line" and snapshot}
+            job_id = client.submit(json.loads(route.to_json()), **paths, output_path=self.output_path, api_key=self.api_key,
+                                   use_llm=self.use_llm, parallel=True, llm_sections=True, invalid=self.invalid)
+            
+            stages, state = 0, None
+            for event in client.events(job_id):
+                if self.isCanceled() and state != "canceling":
+                    client.cancel(job_id)
+                    state = "canceling"
+                if event["event"] == "stage":
+                    stages += 1
+                    self.setProgress(min(95, 5 * stages))
+                    QgsMessageLog.logMessage(f"Worker: {event['layer'] + '.' if event['layer'] else ''}{event['stage']}: {event['seconds']:.3f} s", "UTerra", Qgis.Info)
+                elif event["event"] == "state" and event["state"] in FINAL_STATES:
+                    state = event["state"]
+                    self.error_message = event.get("error") or f"the job was {state}"
+            return state == "done"
+        except Exception as e:
+            self.error_message = f"Worker at {self.worker_url}: {e}"
+            QgsMessageLog.logMessage(f"Error generating report: {self.error_message}", "UTerra", Qgis.Critical)
+            return False
+
     def finished(self, result):
         """Called when the task completes."""
         print("Task finished")
         if result:
+            if self.crossings_path:
+                crossings = QgsVectorLayer(f"{self.crossings_path}|layername=rail_crossings", "Rail crossings", "ogr")
+                if crossings.isValid():
+                    QgsProject.instance().addMapLayer(crossings)
             QMessageBox.information(None, "Success", f"Permit report generated successfully at {self.output_path}")
         else:
             QMessageBox.critical(None, "Error", f"Failed to generate report: {self.error_message}")
@@ -67,6 +155,7 @@ class Uterra:
         self.iface = iface
         self.action = None
         self.dialog = None
+        self.task = None  # The running report task; QGIS does not keep the Python object alive
 
     def initGui(self):
         # Define the icon path
@@ -79,6 +168,9 @@ class Uterra:
         
         self.iface.addToolBarIcon(self.action)
         self.iface.addPluginToMenu("&Uterra Permitting Tool", self.action)
+        
+        # Once the event loop is running, so QGIS startup never waits for it
+        QTimer.singleShot(0, prewarm_imports)
 
     def unload(self):
         # Remove toolbar icon and menu item
@@ -165,36 +257,39 @@ class Uterra:
             QMessageBox.warning(self.dialog, "Input Required", "Please enter an OpenAI API key to use LLM.")
             return
         
-        # Prepare file paths for each layer
-        line_path = line_layer.dataProvider().dataSourceUri() if line_layer else ""
-        cities_path = cities_layer.dataProvider().dataSourceUri() if cities_layer else ""
-        counties_path = counties_layer.dataProvider().dataSourceUri() if counties_layer else ""
-        padus_path = padus_layer.dataProvider().dataSourceUri() if padus_layer else ""
-        rail_path = rail_layer.dataProvider().dataSourceUri() if rail_layer else ""
+        # Capture each layer's features (respecting its selection and filter) on the main thread;
+        # the task exports them in the background, so memory, database and GeoPackage layers all work
+        layers = {
+            "line": line_layer,
+            "cities": cities_layer,
+            "counties": counties_layer,
+            "padus": padus_layer,
+            "rail": rail_layer,
+        }
+        layers = {name: LayerSnapshot(layer, LAYER_COLUMNS[name]) if layer else None for name, layer in layers.items()}
 
         # Create and start the task
-        task = GenerateReportTask(
+        self.task = GenerateReportTask(
             "Generating Permit Report to " + output_path,
-            line_path,
-            cities_path,
-            counties_path,
-            padus_path,
-            rail_path,
+            layers,
             os.path.join(output_path, "permit_report.md"),
             api_key,
-            use_llm
+            use_llm,
+            # Set uterra/worker_url (e.g. http://127.0.0.1:8750) to run reports on a resident worker
+            QSettings().value("uterra/worker_url", "") or None,
+            QSettings().value("uterra/trace_memory", False, type=bool),
+            QSettings().value("uterra/invalid_geometries", "repair")
         )
-        print("Adding task to task manager")
-        QgsApplication.taskManager().addTask(task)
         
-        # Check the task state after a short delay
-        for _ in range(5):
-            time.sleep(0.5)  # Wait for half a second
-            if task.isActive():
-                print("Task is now active")
-                break
-            elif task.isCanceled():
-                print("Task was canceled")
-                break
-            else:
-                print("Task is still not active, checking again...")
\ No newline at end of file
+        # Follow the task through its signals; the button is disabled until it ends
+        self.task.begun.connect(lambda: print("Task is now active"))
+        self.task.taskCompleted.connect(self.task_ended)
+        self.task.taskTerminated.connect(self.task_ended)
+        self.dialog.generate_report_button.setEnabled(False)
+        print("Adding task to task manager")
+        QgsApplication.taskManager().addTask(self.task)
+
+    def task_ended(self):
+        self.task = None
+        if self.dialog:
+            self.dialog.generate_report_button.setEnabled(True)
\ No newline at end of file
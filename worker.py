@@ -0,0 +1,284 @@
+import itertools
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8750
+
+# get_permit_summary options a job may set; the worker supplies the caches itself
+JOB_OPTIONS = ["cities_path", "counties_path", "padus_path", "rail_path", "output_path", "use_llm", "api_key", "bounded_read",
+               "parallel", "max_workers", "corridor", "units", "measures", "perf_appendix", "llm_sections", "base_url", "max_concurrency", "invalid"]
+
+# States a job ends in; its event stream closes after the first of these
+FINAL_STATES = ("done", "failed", "canceled")
+
+
+class JobCanceled(Exception):
+    """Raised at the next stage boundary of a job that was asked to stop."""
+
+
+class Job:
+    """One get_permit_summary run in the worker, with the events it has produced so far."""
+    def __init__(self, job_id, options):
+        self.id = job_id
+        self.options = options
+        self.state = "queued"
+        self.events = []
+        self.error = None
+        self.report = None
+        self.future = None
+        self.cancel_requested = False
+        self.finished_at = None  # time.monotonic() when the job reached one of the FINAL_STATES
+        self._changed = threading.Condition()
+
+    def emit(self, event):
+        with self._changed:
+            self.events.append(event)
+            self._changed.notify_all()
+
+    def set_state(self, state, **details):
+        self.state = state
+        if state in FINAL_STATES:
+            self.finished_at = time.monotonic()
+        self.emit({"event": "state", "state": state, **details})
+
+    def on_stage(self, record):
+        self.emit({"event": "stage", **record.to_dict()})
+        if self.cancel_requested:
+            raise JobCanceled(f"job {self.id} was canceled")
+
+    def cancel(self):
+        """Stop the job: at once if it has not started, otherwise when its current stage finishes."""
+        self.cancel_requested = True
+        if self.future is not None and self.future.cancel():
+            self.set_state("canceled")
+
+    def follow(self, heartbeat=5):
+        """Yield the job's events as they happen, starting from the first, until it ends.
+
+        A heartbeat event is yielded every ``heartbeat`` seconds without news, so a client waiting on
+        a long stage can tell the worker is still there and can still cancel.
+        """
+        seen = 0
+        while True:
+            with self._changed:
+                if seen == len(self.events):
+                    self._changed.wait(heartbeat)
+                events = self.events[seen:]
+            seen += len(events)
+            yield from events or [{"event": "heartbeat"}]
+            if self.state in FINAL_STATES and seen == len(self.events):
+                return
+
+    def to_dict(self):
+        return {"id": self.id, "state": self.state, "error": self.error, "report": self.report,
+                "stages": [event for event in self.events if event["event"] == "stage"]}
+
+
+class Worker:
+    """A long-lived process that runs permit reports next to warm reference layers.
+
+    Layers are kept preprocessed, with their spatial indexes built, in the process-wide LayerCache, so
+    only the first job touching a layer pays for reading it. ``preload`` maps layer names ("cities",
+    "counties", "padus", "rail") to files loaded before the first job. Up to ``max_jobs`` jobs run at
+    once; the rest wait in a queue. With ``store`` and ``tiles``, jobs also use the ResultStore and
+    the partitioned layers. Finished jobs, with their events and report, are forgotten ``job_ttl``
+    seconds after they end, and the oldest beyond the last ``max_finished_jobs`` sooner.
+    """
+    def __init__(self, max_jobs=1, preload=None, store=False, tiles=False, job_ttl=3600, max_finished_jobs=100):
+        from .cache import default_cache, default_guidance_cache, default_store
+        from .tiles import default_tiles
+
+        self.cache = default_cache()
+        self.guidance_cache = default_guidance_cache()
+        self.store = default_store() if store else None
+        self.tiles = default_tiles() if tiles else None
+        self.jobs = {}
+        self.job_ttl = job_ttl
+        self.max_finished_jobs = max_finished_jobs
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="uterra-job")
+        self.preload(preload or {})
+
+    def preload(self, layers):
+        from .classes import CitiesShapefile, CountiesShapefile, PADUSShapefile, RailShapefile
+
+        classes = {"cities": CitiesShapefile, "counties": CountiesShapefile, "padus": PADUSShapefile, "rail": RailShapefile}
+        for name, path in layers.items():
+            if path:
+                classes[name](path, cache=self.cache)
+                print(f"Loaded {name} layer from {path}")
+
+    def submit(self, line, **options):
+        """Queue a report for ``line`` (a route file path, or GeoJSON features in EPSG:4326) and return its Job."""
+        unknown = set(options) - set(JOB_OPTIONS)
+        if unknown:
+            raise ValueError(f"Unknown job options: {', '.join(sorted(unknown))}")
+        with self._lock:
+            self._prune()
+            job = Job(str(next(self._ids)), options)
+            self.jobs[job.id] = job
+        job.emit({"event": "state", "state": "queued"})
+        job.future = self._executor.submit(self._run, job, line)
+        return job
+
+    def job(self, job_id):
+        """Return the job with ``job_id``, or None if there is none or it has been forgotten."""
+        with self._lock:
+            self._prune()
+            return self.jobs.get(job_id)
+
+    def job_states(self):
+        """Return the number of jobs the worker still holds in each state."""
+        with self._lock:
+            self._prune()
+            jobs = list(self.jobs.values())
+        return {state: sum(job.state == state for job in jobs) for state in ("queued", "running", *FINAL_STATES)}
+
+    def _prune(self):
+        # Called with the lock held. A client still following a forgotten job keeps its events until the stream ends
+        finished = sorted((job for job in self.jobs.values() if job.finished_at is not None), key=lambda job: job.finished_at)
+        expired = time.monotonic() - self.job_ttl
+        for i, job in enumerate(finished):
+            if job.finished_at <= expired or i < len(finished) - self.max_finished_jobs:
+                del self.jobs[job.id]
+
+    def _run(self, job, line):
+        import geopandas as gpd
+        from .instrumentation import RunStats
+        from .permits import get_permit_summary
+
+        if job.cancel_requested:
+            job.set_state("canceled")
+            return
+        job.set_state("running")
+        try:
+            if isinstance(line, dict):
+                line = gpd.GeoDataFrame.from_features(line, crs="EPSG:4326")
+            job.report = get_permit_summary(line, **job.options, cache=self.cache, store=self.store, tiles=self.tiles,
+                                            guidance_cache=self.guidance_cache, stats=RunStats(memory=False, on_stage=job.on_stage))
+        except Exception as e:
+            # A cancellation can surface wrapped, e.g. in a LayerIntersectionError from a parallel run
+            if job.cancel_requested:
+                job.set_state("canceled")
+            else:
+                job.error = str(e)
+                job.set_state("failed", error=job.error)
+            return
+        job.set_state("done")
+
+    def serve(self, host=DEFAULT_HOST, port=DEFAULT_PORT):
+        """Serve the HTTP API until interrupted. Bound to localhost by default, as jobs read and write local files."""
+        server = ThreadingHTTPServer((host, port), _handler(self))
+        server.daemon_threads = True
+        print(f"UTerra worker listening on http://{host}:{port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def _handler(worker):
+    class Handler(BaseHTTPRequestHandler):
+        """The worker's API.
+
+        ``POST /jobs`` with ``{"line": ..., **options}`` queues a report and returns the job;
+        ``GET /jobs/<id>`` returns its state, stages and report; ``GET /jobs/<id>/events`` streams its
+        events as JSON lines until it ends; ``DELETE /jobs/<id>`` cancels it; ``GET /health`` reports
+        the worker's jobs and resident layers. Jobs the worker has forgotten are 404s.
+        """
+        def do_GET(self):
+            parts = self.path.strip("/").split("/")
+            if parts == ["health"]:
+                return self._send(200, {"status": "ok", "layers": worker.cache.resident_layers(), "jobs": worker.job_states()})
+            job = self._job(parts)
+            if job is None:
+                return
+            if parts[2:] == ["events"]:
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for event in job.follow():
+                    self.wfile.write(json.dumps(event).encode() + b"\n")
+                    self.wfile.flush()
+                return
+            self._send(200, job.to_dict())
+
+        def do_POST(self):
+            if self.path.strip("/") != "jobs":
+                return self._send(404, {"error": "not found"})
+            try:
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                job = worker.submit(body.pop("line"), **body)
+            except (KeyError, ValueError, TypeError) as e:
+                return self._send(400, {"error": f"bad job: {e}"})
+            self._send(202, job.to_dict())
+
+        def do_DELETE(self):
+            job = self._job(self.path.strip("/").split("/"))
+            if job is not None:
+                job.cancel()
+                self._send(202, job.to_dict())
+
+        def _job(self, parts):
+            job = worker.job(parts[1]) if len(parts) >= 2 and parts[0] == "jobs" else None
+            if job is None:
+                self._send(404, {"error": "no such job"})
+            return job
+
+        def _send(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass  # Progress is in the job events; per-request logging would drown it
+
+    return Handler
+
+
+class WorkerClient:
+    """Submit jobs to a running worker and follow them, from the plugin or from scripts."""
+    def __init__(self, url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=30):
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+
+    def submit(self, line, **options):
+        """Queue a report and return the job id; ``line`` is a route file path on the worker's machine or GeoJSON features."""
+        return self._request("POST", "/jobs", {"line": line, **options})["id"]
+
+    def job(self, job_id):
+        return self._request("GET", f"/jobs/{job_id}")
+
+    def events(self, job_id):
+        """Yield the job's events (dicts with an ``event`` of "state" or "stage") until it ends."""
+        with urllib.request.urlopen(f"{self.url}/jobs/{job_id}/events", timeout=self.timeout) as response:
+            for line in response:
+                yield json.loads(line)
+
+    def cancel(self, job_id):
+        return self._request("DELETE", f"/jobs/{job_id}")
+
+    def health(self):
+        return self._request("GET", "/health")
+
+    def _request(self, method, path, body=None):
+        data = json.dumps(body).encode() if body is not None else None
+        request = urllib.request.Request(self.url + path, data=data, method=method, headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request, timeout=self.timeout) as response:
+                return json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            raise ValueError(f"Worker error {e.code}: {json.loads(e.read()).get('error')}") from e